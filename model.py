@@ -4,6 +4,9 @@ import os
 from .src import writenml as wn
 from .src import atmosphere as atm
 from .src import dirstruc as ds
+from .src import metrics as mt
+from .src import prems
+from .src import planner
 
 __all__ = ['Model']
 
@@ -17,7 +20,8 @@ class Model(object):
                  b_field = 'off', b_surf = 0.1, b_pert_age = 0.1, 
                  b_gamma = 2.0, chi_f = '1.0', fc_tach = 0.15, 
                  eq_lambda = 0.0, b_rad_prof = 'dipole', dynamo = 'rot', 
-                 b_field_ramp = 'no', run_log = True):
+                 b_field_ramp = 'no', start_model = 'poly', run_log = True,
+                 queue = True):
         """ Create a new instance of DMESTAR
     
         The base class for initializing a stellar model using DMESTAR. The
@@ -130,6 +134,21 @@ class Model(object):
                                time. ('no')
                                options --- 'yes'
                                            'no'
+            
+            start_model  ::    starting model for the evolution. ('poly')
+                               options --- 'poly'    = new seed polytrope
+                                           'library' = nearest stored pre-MS
+                                                       model, rescaled to the
+                                                       requested mass and
+                                                       composition. Skips the
+                                                       early pre-MS; falls back
+                                                       to 'poly' if the library
+                                                       has no close model.
+
+            queue        ::    count the run as queued in the grid metrics
+                               on creation. the grid planner creates its
+                               models with queue = False and counts only
+                               the runs it schedules. (True)
 
            Returns:
            --------
@@ -157,14 +176,6 @@ class Model(object):
         else:
             self.tau = tau_atm
         
-        # convective mixing length
-        if a_mlt == 'solar':
-            from .src import mixture
-            solar = mixture.solar_calib[self.mix]
-            self.a_mlt  = solar[3]
-        else:
-            self.a_mlt  = float(a_mlt)
-        
         # other model properties
         self.N_models      = int(n_models)
         self.final_age     = float(final_age)
@@ -173,6 +184,22 @@ class Model(object):
         self.EOS           = str(eos)
         self.nuclearS      = str(nuclear_svals)
         
+        # solar calibration made with the same physics, if there is one
+        from .src import mixture
+        self.calib = mixture.calibName(self.mix, self.EOS, self.nuclearS,
+                                       self.turb_diff, self.atm)
+        if self.calib not in mixture.solar_calib:
+            if a_mlt == 'solar' or 'calc' in [x, y, z]:
+                print 'WARNING: No solar calibration for {0}. Using {1}.'.format(self.calib, self.mix)
+            self.calib = self.mix
+        
+        # convective mixing length
+        if a_mlt == 'solar':
+            solar = mixture.solar_calib[self.calib]
+            self.a_mlt  = solar[3]
+        else:
+            self.a_mlt  = float(a_mlt)
+        
         # magnetic field properties
         self.b_field       = str(b_field)
         self.b_surf        = float(b_surf)       
@@ -187,6 +214,18 @@ class Model(object):
         self.b_rad_prof    = str(b_rad_prof)
         self.dynamo        = str(dynamo)
         self.b_field_ramp  = str(b_field_ramp)
+        
+        # starting model, resolved by setStartModel()
+        self.start_model   = str(start_model)
+        self.start         = None
+        
+        # evolution code and final location of output files
+        self.binary        = ds.binary + 'dmestar'
+        self.outdir        = ds.outdir
+        
+        self.queue         = bool(queue)
+        if self.queue:
+            mt.registry.queued()
      
     def evolve(self):
         """ Evolve an actual DMESTAR model 
@@ -213,27 +252,67 @@ class Model(object):
             
         """
         import subprocess as sp
+        import resource
+        import time
         
-        # create new seed polytrope
-        new_polyt = sp.Popen('{0}'.format(ds.mach + 'newpoly'), 
-                             shell = False) .communicate(input = None)
+        mt.registry.started()
+        usage  = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_0  = usage.ru_utime + usage.ru_stime
+        wall_0 = time.time()
         
-        # create new stellar evolution model
-        new_model = sp.Popen('{0}'.format(ds.binary + 'dmestar'), 
-                             shell = False) .communicate(input = None)
+        state = 'completed'
+        try:
+            # create new seed polytrope unless starting from a stored model
+            if self.start == None:
+                new_polyt = sp.Popen('{0}'.format(ds.mach + 'newpoly'), 
+                                     shell = False)
+                new_polyt.communicate(input = None)
+                if new_polyt.returncode != 0:
+                    state = 'failed'
+            
+            # create new stellar evolution model
+            new_model = sp.Popen('{0}'.format(self.binary), 
+                                 shell = False)
+            new_model.communicate(input = None)
+            
+            if new_model.returncode != 0:
+                state = 'failed'
+        except KeyboardInterrupt:
+            state = 'aborted'
+            raise
+        except OSError:
+            state = 'failed'
+            raise
+        finally:
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            self.status   = state
+            self.run_time = time.time() - wall_0
+            self.cpu_time = usage.ru_utime + usage.ru_stime - cpu_0
+            self.models_run = mt.countModels('{0}.trk'.format(self.fout))
+            mt.registry.finished(state, wall_time = self.run_time, 
+                                 cpu_time  = self.cpu_time,
+                                 n_models  = self.models_run,
+                                 out_bytes = mt.outputBytes(self.fout))
+        
+        if state == 'completed':
+            # record inputs for incremental grid updates
+            planner.record(self)
+            
+            # keep short runs from a polytrope as future starting models
+            if self.start == None and self.final_age <= prems.max_age:
+                prems.store(self)
         self.cleanup()
         
     def construct(self):
         """ Automatically call all required setup routines """
-        self.scratch()
-        self.setAbundances()
-        self.setAtmosphere()
-        self.polyNamelist()
-        self.physNamelist()
-        self.ctrlNamelist()
-        self.magNamelist()
-        self.linkInputData()
-        self.linkOutputData()
+        import time
+        
+        for phase in [self.scratch, self.setAbundances, self.setStartModel, self.setAtmosphere,
+                      self.polyNamelist, self.physNamelist, self.ctrlNamelist,
+                      self.magNamelist, self.linkInputData, self.linkOutputData]:
+            start = time.time()
+            phase()
+            mt.registry.observeSetup(phase.__name__, time.time() - start)
         
     def scratch(self):
         """ Construct a scratch directory using username and 8 digits """
@@ -255,11 +334,28 @@ class Model(object):
         try:
             os.remove('./fort.15')
             self.cleanup()
+            mt.registry.finished('aborted')
             import sys
             sys.exit('ERROR: Previous instance of DMESTAR was found and cleaned.')
         except OSError:
             pass
         
+        print '\nLinking Library Files:'
+        print '----------------------'
+        for unit, filepath in self.inputFiles():
+            self.link('', filepath, unit)
+        
+        # Namelist files
+        self.link('./', 'physics.nml',  'fort.13')
+        self.link('./', 'control.nml',  'fort.14')
+        self.link('./', 'magnetic.nml', 'fort.75')
+        print ''
+    
+    def inputFiles(self):
+        """ Library files read through Fortran units, as (unit, path) pairs 
+            
+            Requires setAtmosphere() and setStartModel() to have been called.
+        """
         # Generate name for OPAL 95 opacity tables
         if self.afe == 0.0:
             opal95_tab = '{0}hz'.format(self.mix.upper())
@@ -267,32 +363,27 @@ class Model(object):
             opal95_tab = '{0}hz_OFe{1}'.format(self.mix.upper(), str(self.afe)[1:3])
         
         # DO NOT TOUCH: opacity files
-        print '\nLinking Library Files:'
-        print '----------------------'
-        self.link(ds.opac, 'FERMI.TAB', 'fort.15')
-        self.link(ds.opac, 'thecond_07.d', 'fort.35')
-        self.link(ds.opal, opal95_tab, 'fort.48')
+        files = [('fort.15', ds.opac + 'FERMI.TAB'),
+                 ('fort.35', ds.opac + 'thecond_07.d'),
+                 ('fort.48', ds.opal + opal95_tab)]
         
         # Equation of state tables
-        self.link(ds.eos, 'opal01/opaleos01.z0188', 'fort.49')
-        self.link(ds.eos, 'scvh/h_tab_i.dat', 'fort.72')
-        self.link(ds.eos, 'scvh/he_tab_i.dat', 'fort.73')
+        files += [('fort.49', ds.eos + 'opal01/opaleos01.z0188'),
+                  ('fort.72', ds.eos + 'scvh/h_tab_i.dat'),
+                  ('fort.73', ds.eos + 'scvh/he_tab_i.dat')]
         
         # Atmosphere files
-        self.link(ds.kur, self.kur_f, 'fort.38')
+        files.append(('fort.38', ds.kur + self.kur_f))
         for i in range(5): 
-            os.symlink(self.phx_f[i], 'fort.{:.0f}'.format(95 + i))
-            print 'Linked: {:s} ---> fort.{:.0f}'.format(self.phx_f[i], 95 + i)
+            files.append(('fort.{:.0f}'.format(95 + i), self.phx_f[i]))
         
-        # Namelist files
-        self.link('./', 'physics.nml',  'fort.13')
-        self.link('./', 'control.nml',  'fort.14')
-        self.link('./', 'magnetic.nml', 'fort.75')
-        print ''
+        # Starting model from the pre-MS library
+        if self.start != None:
+            files.append((prems.start_unit, ds.prems + self.start['file']))
+        return files
     
-    def linkOutputData(self):
-        """ Redirect output to permanent files """
-        # create output file name
+    def outputName(self):
+        """ Root name shared by all output files of this model """
         fout = 'm{:04.0f}_{:s}_{:s}{:03.0f}_{:s}{:01.0f}_mlt{:4.3f}'.format(
                 self.mass*1000., self.mix, atm.plusMinus(self.feh), abs(self.feh)*100.,
                 atm.plusMinus(self.afe), abs(self.afe)*10., self.a_mlt)
@@ -301,7 +392,11 @@ class Model(object):
                 fout += '_mag{:02.0f}kG'.format(self.b_surf/100.)
             else:
                 fout += '_magL{:04.0f}'.format(self.eq_lambda*10000.)
-        
+        return fout
+    
+    def linkOutputData(self):
+        """ Redirect output to permanent files """
+        fout = self.outputName()
         self.fout = fout
         
         tmp = './'
@@ -346,8 +441,13 @@ class Model(object):
         
     def ctrlNamelist(self):
         """ Write the control namelist """
+        if self.start != None:
+            rescale_mass = self.mass
+        else:
+            rescale_mass = None
         wn.writeCtrlNamelist(self.x, self.y, self.z, self.afe, self.a_mlt, self.mix,
-                             final_age = self.final_age, n_models = self.N_models)
+                             final_age = self.final_age, n_models = self.N_models,
+                             rescale_mass = rescale_mass)
         
     def magNamelist(self):
         """ Write the magnetic namelist file """
@@ -363,16 +463,33 @@ class Model(object):
         else:
             self.kur_f, self.phx_f = atm.select(self.feh, self.afe, atm_tau = self.tau)
     
+    def setStartModel(self):
+        """ Find a stored pre-MS model when starting from the library """
+        self.start = None
+        if self.start_model == 'library':
+            # stored model must predate the end of the run and, for
+            # magnetic runs, the perturbation age (Gyr)
+            age = self.final_age
+            if self.b_field == 'on':
+                age = min(age, self.b_pert_age*1.0e9)
+            self.start = prems.nearest(self.mass, self.feh, self.afe, self.mix, age = age,
+                                       y = self.y, phys = prems.runPhysics(self))
+            if self.start == None:
+                print 'WARNING: No pre-MS library model near {:.3f} Msun. Using a polytrope.'.format(self.mass)
+            else:
+                print 'Starting from pre-MS library model: {0}'.format(self.start['file'])
+    
     def setAbundances(self):
         from .src import mixture
         self.x, self.y, self.z = mixture.setAbundances(self.x, self.y, self.z, 
                                                        self.mix, self.feh, 
-                                                       self.afe, self.y_prim)
+                                                       self.afe, self.y_prim,
+                                                       calib = self.calib)
     
     def cleanup(self):
         """ Clean up after model run """
         try:
-            os.system('mv {0}/{1}.* {2}/'.format(os.getcwd(), self.fout, ds.outdir))
+            os.system('mv {0}/{1}.* {2}/'.format(os.getcwd(), self.fout, self.outdir))
         except:
             pass
         os.system('rm fort.*')
@@ -1,4 +1,8 @@
 #
 #
 
-__all__ = ['atmosphere', 'mixture', 'writenml', 'dirstruc', 'errors']
+__all__ = ['atmosphere', 'mixture', 'writenml', 'dirstruc', 'errors', 'metrics',
+           'tracks', 'calibrate', 'trackindex',
+           'trackstore', 'lastmodel', 'popsynth',
+           'archive', 'benchmark', 'prems',
+           'planner']
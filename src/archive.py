@@ -0,0 +1,232 @@
+#
+#
+import os
+import re
+import json
+import glob
+import struct
+from . import tracks
+
+# shard layout:  magic | chunk | chunk | ... | index (compressed JSON) | footer
+# footer:        index offset, index length (little-endian uint64) | magic
+magic     = 'DMESTARA'
+footer    = struct.Struct('<QQ8s')
+codecs    = ['zlib', 'bz2']
+
+# the manifest, prefix.dsm, lists the shards written by the last pack()
+manifest  = '.dsm'
+
+# model output files packed by default (see Model.linkOutputData)
+extensions = ['.trk', '.dtrk', '.short', '.last', '.mag', '.menv']
+
+def compress(data, codec, level = 9):
+    if codec == 'bz2':
+        import bz2
+        return bz2.compress(data, level)
+    import zlib
+    return zlib.compress(data, level)
+
+def decompress(data, codec):
+    if codec == 'bz2':
+        import bz2
+        return bz2.decompress(data)
+    import zlib
+    return zlib.decompress(data)
+
+def transpose(data, width, inverse = False):
+    """ Byte-transpose a block of fixed-width lines (columnar layout) """
+    import numpy as np
+    block = np.frombuffer(data, dtype = np.uint8)
+    if inverse:
+        return block.reshape(width, -1).T.tobytes()
+    return block.reshape(-1, width).T.tobytes()
+
+def splitChunks(data, chunk_lines = 4096, min_lines = 16):
+    """ Split text into (layout, width, bytes) chunks
+
+        Runs of at least min_lines lines with identical length, i.e. the
+        fixed-format numeric tables written by DMESTAR, are stored
+        column-major ('T') so that each column of digits compresses
+        together. Everything else, such as headers, is stored as is ('R').
+    """
+    chunks, raw, group = [], [], []
+
+    def flushRaw():
+        if len(raw) > 0:
+            chunks.append(('R', 0, ''.join(raw)))
+            del raw[:]
+
+    def flushGroup():
+        if len(group) >= min_lines:
+            flushRaw()
+            chunks.append(('T', len(group[0]), ''.join(group)))
+        else:
+            raw.extend(group)
+        del group[:]
+
+    for line in data.splitlines(True):
+        if len(group) > 0 and (len(line) != len(group[0]) or len(group) >= chunk_lines):
+            flushGroup()
+        group.append(line)
+    flushGroup()
+    flushRaw()
+    return chunks
+
+
+class Shard(object):
+
+    def __init__(self, filename):
+        """ Open one archive shard and read its embedded index """
+        self.filename = filename
+        with open(filename, 'rb') as shard:
+            if shard.read(len(magic)) != magic:
+                raise IOError('{0} is not a DMESTAR archive.'.format(filename))
+            shard.seek(-footer.size, os.SEEK_END)
+            offset, length, tail = footer.unpack(shard.read(footer.size))
+            if tail != magic:
+                raise IOError('{0} is truncated.'.format(filename))
+            shard.seek(offset)
+            index = json.loads(decompress(shard.read(length), 'zlib'))
+        self.codec   = str(index['codec'])
+        self.members = index['members']
+
+    def read(self, name):
+        """ Decompress a single member, touching only its own chunks """
+        text = []
+        with open(self.filename, 'rb') as shard:
+            for offset, length, layout, width in self.members[name]['chunks']:
+                shard.seek(offset)
+                data = decompress(shard.read(length), self.codec)
+                if layout == 'T':
+                    data = transpose(data, width, inverse = True)
+                text.append(data)
+        return ''.join(text)
+
+
+class GridArchive(object):
+
+    def __init__(self, prefix):
+        """ The shards listed in the manifest written by pack() for prefix
+
+            Only shards of the latest pack() are opened, so stale shards
+            left by an earlier pack, or shards of another prefix, are never
+            read.
+        """
+        try:
+            with open(prefix + manifest, 'r') as dsm:
+                shards = json.load(dsm)['shards']
+        except IOError:
+            raise IOError('No archive manifest found for {0}.'.format(prefix))
+        directory   = os.path.dirname(prefix)
+        self.shards = [Shard(os.path.join(directory, f)) for f in shards]
+        if len(self.shards) == 0:
+            raise IOError('No archive shards found for {0}.'.format(prefix))
+        self.location = {}
+        for shard in self.shards:
+            for name in shard.members:
+                self.location[name] = shard
+
+    def names(self):
+        return sorted(self.location)
+
+    def read(self, name):
+        """ Contents of one packed file, e.g. 'm1000_GS98_p000_p0_mlt1.884.trk' """
+        return self.location[name].read(name)
+
+    def readTrack(self, fout):
+        """ A single track (by output root name) as a dictionary of columns """
+        from StringIO import StringIO
+        return tracks.readTrack(StringIO(self.read(fout + '.trk')))
+
+    def unpack(self, outdir, names = None):
+        """ Write packed files (all by default) back to a directory """
+        if names == None:
+            names = self.names()
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        for name in names:
+            with open(os.path.join(outdir, name), 'wb') as out:
+                out.write(self.read(name))
+            mtime = self.location[name].members[name]['mtime']
+            os.utime(os.path.join(outdir, name), (mtime, mtime))
+
+def pack(prefix, directory = None, n_shards = 4, codec = 'zlib', level = 9,
+         extensions = extensions, remove = False):
+    """ Pack a grid output directory (ds.outdir) into sharded archives
+
+        All output files of one model go to the same shard, and models are
+        spread over n_shards files of roughly equal size. Each file is
+        compressed in independent chunks so that it can be read back
+        without decompressing the rest of its shard. Shards are written to
+        prefix_00.dsa, prefix_01.dsa, ... and listed in the manifest
+        prefix.dsm; shards of an earlier pack() to the same prefix that
+        were not rewritten are deleted. With remove = True the original
+        files are deleted once all shards have been written.
+    """
+    from . import dirstruc as ds
+
+    if codec not in codecs:
+        raise ValueError('Unknown codec: {0}'.format(codec))
+    if directory == None:
+        directory = ds.outdir
+
+    # group files by model so that a model never spans two shards
+    models = {}
+    for ext in extensions:
+        for f in glob.glob(os.path.join(directory, '*' + ext)):
+            info = tracks.parseName(f)
+            root = info['fout'] if info != None else os.path.basename(f)[:-len(ext)]
+            models.setdefault(root, []).append(f)
+
+    # largest models first, each to the currently smallest shard
+    sizes  = dict((root, sum(os.path.getsize(f) for f in files)) for root, files in models.items())
+    shards = [[] for i in range(n_shards)]
+    totals = [0]*n_shards
+    for root in sorted(models, key = lambda r: -sizes[r]):
+        k = totals.index(min(totals))
+        shards[k].extend(sorted(models[root]))
+        totals[k] += sizes[root]
+
+    written = []
+    for k, files in enumerate(shards):
+        if len(files) == 0:
+            continue
+        filename = '{0}_{1:02.0f}.dsa'.format(prefix, k)
+        members  = {}
+        with open(filename + '.tmp', 'wb') as shard:
+            shard.write(magic)
+            for f in files:
+                with open(f, 'rb') as member:
+                    data = member.read()
+                entry = []
+                for layout, width, text in splitChunks(data):
+                    if layout == 'T':
+                        text = transpose(text, width)
+                    block = compress(text, codec, level)
+                    entry.append([shard.tell(), len(block), layout, width])
+                    shard.write(block)
+                members[os.path.basename(f)] = {'chunks': entry, 'size': len(data),
+                                                'mtime': os.path.getmtime(f)}
+            index  = compress(json.dumps({'codec': codec, 'members': members}), 'zlib')
+            offset = shard.tell()
+            shard.write(index)
+            shard.write(footer.pack(offset, len(index), magic))
+        os.rename(filename + '.tmp', filename)
+        written.append(filename)
+        print 'Packed {0:.0f} files into {1}'.format(len(files), filename)
+
+    # the manifest makes the new set of shards current in one step
+    with open(prefix + manifest + '.tmp', 'w') as dsm:
+        json.dump({'shards': [os.path.basename(f) for f in written]}, dsm, indent = 1)
+    os.rename(prefix + manifest + '.tmp', prefix + manifest)
+
+    pattern = re.compile(re.escape(os.path.basename(prefix)) + r'_\d{2}\.dsa$')
+    for f in glob.glob(prefix + '_*.dsa'):
+        if pattern.match(os.path.basename(f)) and f not in written:
+            os.remove(f)
+
+    if remove:
+        for files in shards:
+            for f in files:
+                os.remove(f)
+    return written
@@ -1,5 +1,23 @@
 #
 #
+import os
+import re
+from .errors import AtmosphereError
+
+# PHOENIX table directories (see dirstruc) and their mixture, keyed by tau
+phx_dirs = {10 : ('phxnorm', 'GS98'),
+            100: ('phxt100', 'GS98'),
+            0  : ('phxteff', 'AGSS09')}
+
+phx_pattern = re.compile(r'^[Zz]_?(?P<feh>[pm]\dd\d)\.a(?:fe_)?(?P<afe>[pm]\dd\d)(?:_t\d{3})?\.dat$')
+kur_pattern = re.compile(r'^atmk1990(?P<feh>[pm]\d\d)\.tab$')
+
+# number of PHOENIX tables linked to fort.95 - fort.99
+n_window = 5
+
+# catalogues already scanned in this process
+catalogues = {}
+
 def plusMinus(value):
     """ Convert sign to character """
     if value < 0.0:
@@ -8,56 +26,124 @@ def plusMinus(value):
         value = 'p'
     return value
 
-def select(feh, afe, atm_tau = 10):
-    """ Select appropriate atmosphere files """
-    import os
-    from sys import exit
-    from . import dirstruc as ds
-    
-    fort_files = ['fort.{:.0f}'.format(x) for x in range(95, 100)]
-    if (feh < -1.0 or feh > 0.5):
-        exit("\nERROR: Invalid [Fe/H] in atmosphere selection.\n")
-    if afe not in [0.0, 0.2, 0.4]:
-        exit("\nERROR: Invalid [a/Fe] in atmosphere selection.\n")
-    for f in fort_files:
+def tenths(code):
+    """ Convert a file name abundance code, e.g. 'm0d5' or 'p03', to tenths of dex """
+    digits = code[1:].replace('d', '')
+    return int(digits)*(-1 if code[0] == 'm' else 1)
+
+
+class Catalogue(object):
+
+    def __init__(self, index = None):
+        """ Initialize new instance of Catalogue
+
+            An in-memory index of the PHOENIX and Kurucz boundary-condition
+            tables available under ds.phx and ds.kur. The directories are
+            scanned once (or the index is loaded from a file written by
+            save()), after which atmosphere selection needs no file system
+            access. Abundances are stored as integer tenths of a dex.
+        """
+        if index == None:
+            index = self.scan()
+        self.phx = index['phx']
+        self.kur = index['kur']
+
+    @staticmethod
+    def scan():
+        """ List the tables present in the atmosphere directories """
+        from . import dirstruc as ds
+
+        phx = {}
+        for tau, (attr, mix) in phx_dirs.items():
+            directory = getattr(ds, attr)
+            try:
+                files = os.listdir(directory)
+            except OSError:
+                continue
+            for f in files:
+                match = phx_pattern.match(f)
+                if match == None:
+                    continue
+                key = '{0}:{1:.0f}:{2:+.0f}'.format(mix, tau, tenths(match.group('afe')))
+                phx.setdefault(key, {})[str(tenths(match.group('feh')))] = directory + f
+
+        kur = {}
         try:
-            os.remove(f)
+            files = os.listdir(ds.kur)
         except OSError:
-            pass
-    
-    # generate Kurucz atmosphere file name
-    kur_file = 'atmk1990{0}{1}{2}.tab'.format(plusMinus(feh), 
-                                              str(abs(round(feh, 1)))[0],
-                                              str(abs(round(feh, 1)))[2])
-    
-    #--- NOTE, add other mixtures later
-    # GS98 specific 
-    # protect against issues at edge of grid
-    if feh < -0.3:
-        feh = -0.3
-    elif feh > 0.3:
-        feh = 0.3
-    else:
-        pass
-    feh  = round(feh, 1)
-    
-    # generate atmosphere file names
-    feh_list  = [round(feh + float(x)/10., 1) for x in range(-2, 3)]
-    if atm_tau == 10:
-        phx_files = ["{0}Z{1}{2}d{3}.a{4}{5}d{6}_t010.dat".format(ds.phxnorm, 
-                      plusMinus(x), str(abs(x))[0], str(abs(x))[2], plusMinus(afe), 
-                      str(abs(afe))[0], str(abs(afe))[2]) for x in feh_list]
-    elif atm_tau == 100:
-        phx_files = ["{0}Z{1}{2}d{3}.a{4}{5}d{6}_t100.dat".format(ds.phxt100, 
-                      plusMinus(x), str(abs(x))[0], str(abs(x))[2], plusMinus(afe), 
-                      str(abs(afe))[0], str(abs(afe))[2]) for x in feh_list]
-    else:
-        phx_files = ["{0}z_{1}{2}d{3}.afe_{4}{5}d{6}.dat".format(ds.phxteff, 
-                      plusMinus(x), str(abs(x))[0], str(abs(x))[2], plusMinus(afe), 
-                      str(abs(afe))[0], str(abs(afe))[2]) for x in feh_list]
-        
-    if len(phx_files) != len(fort_files):
-        exit("\nERROR: Length discrepancy in atmosphere selection routine.\n")
-    
-    return kur_file, phx_files
-    
+            files = []
+        for f in files:
+            match = kur_pattern.match(f)
+            if match != None:
+                kur[str(tenths(match.group('feh')))] = f
+        return {'phx': phx, 'kur': kur}
+
+    @classmethod
+    def load(cls, filename):
+        """ Reload an index written by save() """
+        import json
+        with open(filename, 'r') as cat:
+            return cls(json.load(cat))
+
+    def save(self, filename):
+        """ Store the index so that other processes can skip the directory scan """
+        import json
+        with open(filename, 'w') as cat:
+            json.dump({'phx': self.phx, 'kur': self.kur}, cat, indent = 1)
+
+    def supported(self):
+        """ Available PHOENIX grid cells as (mixture, tau, [a/Fe], [Fe/H] list) """
+        cells = []
+        for key in sorted(self.phx):
+            mix, tau, afe = key.split(':')
+            cells.append((mix, int(tau), int(afe)/10.,
+                          sorted(int(feh)/10. for feh in self.phx[key])))
+        return cells
+
+    def select(self, feh, afe, atm_tau = 10):
+        """ Kurucz table name and the window of PHOENIX tables around [Fe/H]
+
+            The window holds the n_window tables closest to [Fe/H] and is
+            shifted inward at the edges of the grid. Raises AtmosphereError
+            if no Kurucz table exists for [Fe/H], or if the PHOENIX grid for
+            ([a/Fe], tau) is missing or has fewer than n_window tables.
+        """
+        feh_key = int(round(feh*10.))
+        afe_key = int(round(afe*10.))
+        if abs(afe*10. - afe_key) > 1.e-6:
+            raise AtmosphereError('[a/Fe] = {:+.2f} is not on the 0.1 dex table grid.'.format(afe))
+
+        if str(feh_key) not in self.kur:
+            avail = sorted(int(k) for k in self.kur)
+            raise AtmosphereError('No Kurucz table for [Fe/H] = {:+.1f}; available range '
+                                  '{:+.1f} to {:+.1f}.'.format(feh, min(avail)/10., max(avail)/10.)
+                                  if avail else 'No Kurucz tables found.')
+        kur_file = self.kur[str(feh_key)]
+
+        grid = [key for key in self.phx if key.endswith(':{0:.0f}:{1:+.0f}'.format(atm_tau, afe_key))]
+        if len(grid) == 0:
+            raise AtmosphereError('No PHOENIX tables for [a/Fe] = {:+.1f}, tau = {:.0f}.'.format(afe, atm_tau))
+        tables = self.phx[grid[0]]
+        fehs   = sorted(int(k) for k in tables)
+        if len(fehs) < n_window:
+            raise AtmosphereError('Only {:.0f} PHOENIX tables for [a/Fe] = {:+.1f}, tau = {:.0f}.'.format(
+                                  len(fehs), afe, atm_tau))
+
+        # protect against issues at edge of grid
+        nearest = min(range(len(fehs)), key = lambda i: abs(fehs[i] - feh_key))
+        start   = min(max(nearest - n_window//2, 0), len(fehs) - n_window)
+        phx_files = [tables[str(f)] for f in fehs[start:start + n_window]]
+        return kur_file, phx_files
+
+def catalogue(refresh = False):
+    """ The process-wide Catalogue, scanned on first use """
+    from . import dirstruc as ds
+
+    key = (ds.phx, ds.kur)
+    if refresh or key not in catalogues:
+        catalogues[key] = Catalogue()
+    return catalogues[key]
+
+def select(feh, afe, atm_tau = 10):
+    """ Select appropriate atmosphere files """
+    return catalogue().select(feh, afe, atm_tau = atm_tau)
@@ -0,0 +1,223 @@
+#
+#
+# Regression benchmark comparing two builds of the DMESTAR binary.
+#
+# usage: python -m dmestar.src.benchmark BINARY_A BINARY_B [options]
+#
+import os
+import json
+from . import dirstruc as ds
+from . import metrics as mt
+from . import tracks
+
+# fixed reference grid of Model configurations
+reference_grid = [{'mass': 0.2, 'feh':  0.0, 'final_age': 1.0e10},
+                  {'mass': 0.5, 'feh':  0.0, 'final_age': 1.0e10},
+                  {'mass': 1.0, 'feh':  0.0, 'final_age': 1.0e10},
+                  {'mass': 1.0, 'feh': -0.5, 'final_age': 1.0e10},
+                  {'mass': 1.5, 'feh':  0.0, 'final_age': 3.0e9},
+                  {'mass': 0.5, 'feh':  0.0, 'final_age': 1.0e10,
+                   'b_field': 'on', 'b_surf': 2500.}]
+
+# track columns compared at matched EEPs and their absolute tolerances
+compare_columns = {'log_L': 1.e-3, 'log_R': 1.e-3, 'log_g': 1.e-3, 'log_Teff': 5.e-4,
+                   'log_T_c': 1.e-3, 'log_rho_c': 1.e-3, 'x_c': 1.e-3}
+age_tolerance   = 1.e-3         # fractional age difference at matched EEPs
+
+# whole-track checks made before resampling: a binary that stops early must
+# not pass just because its shorter track agrees with the reference
+final_age_tolerance = 1.e-3     # fractional difference of the final age
+models_tolerance    = 0.05      # fractional difference of the number of models
+
+def runModel(args):
+    """ Evolve one reference configuration with one binary (Pool worker)
+
+        A run that cannot be set up (e.g. AtmosphereError) is returned as
+        'failed' with the error message instead of aborting the pool.
+    """
+    from ..model import Model
+
+    binary, config, outdir = args
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    try:
+        star = Model(**config)
+        star.binary = binary
+        star.outdir = outdir
+        star.construct()
+    except (Exception, SystemExit) as err:
+        return {'binary': binary, 'fout': None, 'status': 'failed',
+                'error': '{0}: {1}'.format(type(err).__name__, err), 'track': None,
+                'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'models': 0,
+                'models_per_second': 0.0}
+    error = None
+    try:
+        star.evolve()
+    except OSError as err:
+        # status is already 'failed'. evolve() cleans up only after a run it
+        # could start, so remove the scratch directory unless it is gone
+        error = 'OSError: {0}'.format(err)
+        if os.path.isdir(star.scratch_dir):
+            try:
+                star.cleanup()
+            except OSError:
+                pass
+
+    if star.run_time > 0.0:
+        rate = star.models_run/star.run_time
+    else:
+        rate = 0.0
+    run = {'binary': binary, 'fout': star.fout, 'status': star.status,
+           'track': os.path.join(outdir, star.fout + '.trk'),
+           'wall_seconds': star.run_time, 'cpu_seconds': star.cpu_time,
+           'models': star.models_run, 'models_per_second': rate}
+    if error != None:
+        run['error'] = error
+    return run
+
+def resampleEEP(track, age_max, n_eep = 500):
+    """ Resample a track to points equally spaced in HR-diagram path length
+
+        Only the part of the track younger than age_max is used, so that two
+        tracks ending at different ages are matched over the same evolution.
+        The i-th point of two resampled tracks is then an equivalent
+        evolutionary point.
+    """
+    import numpy as np
+
+    keep = track['age'] <= age_max
+    x, y = track['log_Teff'][keep], track['log_L'][keep]
+    dist = np.concatenate([[0.], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+    eep  = np.linspace(0., dist[-1], n_eep)
+    return dict((col, np.interp(eep, dist, track[col][keep])) for col in track)
+
+def compareTracks(file_a, file_b, n_eep = 500):
+    """ Column-by-column differences of two tracks at matched EEPs
+
+        The final age and the number of models of the full tracks are
+        compared first, so a track B that ends early fails even if the part
+        it shares with A agrees.
+    """
+    import numpy as np
+
+    a, b = tracks.readTrack(file_a), tracks.readTrack(file_b)
+
+    result = {}
+    diff = abs(b['age'][-1] - a['age'][-1])/max(a['age'][-1], 1.0)
+    result['final_age'] = {'a': float(a['age'][-1]), 'b': float(b['age'][-1]),
+                           'rel_diff': float(diff), 'tolerance': final_age_tolerance,
+                           'pass': bool(diff <= final_age_tolerance)}
+    diff = abs(len(b['age']) - len(a['age']))/float(len(a['age']))
+    result['models'] = {'a': len(a['age']), 'b': len(b['age']),
+                        'rel_diff': diff, 'tolerance': models_tolerance,
+                        'pass': bool(diff <= models_tolerance)}
+
+    age_max = min(a['age'][-1], b['age'][-1])
+    a, b = resampleEEP(a, age_max, n_eep), resampleEEP(b, age_max, n_eep)
+    for col, tol in compare_columns.items():
+        if col in a and col in b:
+            diff = np.abs(a[col] - b[col])
+            result[col] = {'max_abs_diff': float(diff.max()), 'tolerance': tol,
+                           'n_over': int((diff > tol).sum()), 'pass': bool(diff.max() <= tol)}
+    diff = np.abs(a['age'] - b['age'])/np.maximum(a['age'], 1.0)
+    result['age'] = {'max_rel_diff': float(diff.max()), 'tolerance': age_tolerance,
+                     'n_over': int((diff > age_tolerance).sum()),
+                     'pass': bool(diff.max() <= age_tolerance)}
+    return result
+
+def benchmark(binary_a, binary_b, grid = reference_grid, workdir = None,
+              processes = None, n_eep = 500):
+    """ Run the reference grid with two binaries and compare them
+
+        All (binary, configuration) pairs are evolved concurrently in a
+        process pool, each writing to its own output directory under
+        workdir (default ds.outdir/benchmark). Returns a JSON-serializable
+        report with per-model timings, throughput, the speed ratio B/A and
+        the column comparison at matched EEPs. Models for which either run
+        failed are marked 'failed' and counted in the summary.
+    """
+    from multiprocessing import Pool
+
+    if workdir == None:
+        workdir = os.path.join(ds.outdir, 'benchmark')
+    # workers chdir into scratch directories, so output paths must be absolute
+    workdir = os.path.abspath(workdir)
+    jobs = []
+    for label, binary in [('a', binary_a), ('b', binary_b)]:
+        for i, config in enumerate(grid):
+            jobs.append((binary, config, os.path.join(workdir, '{0}{1:02.0f}'.format(label, i))))
+
+    pool = Pool(processes = processes, initializer = mt.startWorker)
+    try:
+        runs = pool.map(runModel, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    models, n_fail, n_broken = [], 0, 0
+    for i, config in enumerate(grid):
+        run_a, run_b = runs[i], runs[i + len(grid)]
+        entry = {'config': config, 'a': run_a, 'b': run_b}
+        entry['failed'] = run_a['status'] != 'completed' or run_b['status'] != 'completed'
+        if not entry['failed']:
+            entry['columns'] = compareTracks(run_a['track'], run_b['track'], n_eep)
+            entry['pass'] = all(col['pass'] for col in entry['columns'].values())
+            n_fail += not entry['pass']
+        else:
+            entry['pass'] = False
+            n_broken += 1
+        if run_a['wall_seconds'] > 0.0:
+            entry['speed_ratio'] = run_b['wall_seconds']/run_a['wall_seconds']
+        models.append(entry)
+
+    summary = {}
+    for label in ['a', 'b']:
+        wall   = sum(m[label]['wall_seconds'] for m in models)
+        n_runs = sum(m[label]['models'] for m in models)
+        summary[label] = {'binary': models[0][label]['binary'] if models else None,
+                          'wall_seconds': wall,
+                          'cpu_seconds': sum(m[label]['cpu_seconds'] for m in models),
+                          'models': n_runs,
+                          'models_per_second': n_runs/wall if wall > 0.0 else 0.0}
+    summary['numerical_regressions'] = n_fail
+    summary['failed_models'] = n_broken
+    return {'summary': summary, 'models': models}
+
+def main(argv = None):
+    """ Command line entry point; exits with status 1 on any regression or failed run """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description = 'Compare two DMESTAR binaries on a reference grid.')
+    parser.add_argument('binary_a', help = 'reference binary')
+    parser.add_argument('binary_b', help = 'binary under test')
+    parser.add_argument('-o', '--output', default = 'benchmark.json',
+                        help = 'report file (default: benchmark.json)')
+    parser.add_argument('-j', '--processes', type = int, default = None,
+                        help = 'number of worker processes (default: all cores)')
+    parser.add_argument('--workdir', default = None,
+                        help = 'directory for model output (default: ds.outdir/benchmark)')
+    args = parser.parse_args(argv)
+
+    report = benchmark(os.path.abspath(args.binary_a), os.path.abspath(args.binary_b),
+                       workdir = args.workdir, processes = args.processes)
+    with open(args.output, 'w') as out:
+        json.dump(report, out, indent = 1, sort_keys = True)
+
+    for label in ['a', 'b']:
+        s = report['summary'][label]
+        print '{0}: {1:8.1f} s wall, {2:8.1f} s CPU, {3:7.2f} models/s'.format(
+              s['binary'], s['wall_seconds'], s['cpu_seconds'], s['models_per_second'])
+    print 'Numerical regressions: {0:.0f} of {1:.0f} models'.format(
+          report['summary']['numerical_regressions'], len(report['models']))
+    for m in report['models']:
+        for label in ['a', 'b']:
+            if m[label]['status'] != 'completed':
+                print 'FAILED {0} {1}: {2}'.format(m[label]['binary'], m['config'],
+                                                  m[label].get('error', m[label]['status']))
+
+    if report['summary']['numerical_regressions'] > 0 or report['summary']['failed_models'] > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#
+#
+import os
+from . import dirstruc as ds
+from . import mixture
+from . import tracks
+from . import metrics as mt
+from .errors import CalibrationError
+
+# solar age (yr) and the targets for a calibrated 1 Msun model
+solar_age = 4.57e9
+solar_log_L = 0.0
+solar_log_R = 0.0
+
+def evolveSolar(args):
+    """ Evolve a 1 Msun model and return log L, log R and (Z/X)surf at solar age
+
+        Accepts a single tuple so that it can be used with Pool.map():
+            (params, outdir, options)
+        where params = (Y_init, (Z/X)_init, a_mlt) and options holds the
+        remaining Model keyword arguments (mixture, eos, etc.). Returns
+        (result, None) on success and (None, message) if the run failed or
+        ended before the solar age, so one bad run does not abort the pool.
+    """
+    from ..model import Model
+
+    params, outdir, options = args
+    y, zx, a_mlt = params
+    x = (1.0 - y)/(1.0 + zx)
+    z = zx*x
+
+    # the polytrope namelist needs a solar Z for uncalibrated mixtures
+    mixture.solar_calib.setdefault(options['mixture'], [x, y, z, a_mlt])
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    try:
+        star = Model(1.0, 0.0, x = x, y = y, z = z, a_mlt = a_mlt,
+                     final_age = 1.05*options.pop('age'), **options)
+        star.outdir = outdir
+        star.construct()
+        star.evolve()
+        if star.status != 'completed':
+            raise CalibrationError('DMESTAR run {0}'.format(star.status))
+
+        track = tracks.readTrack('{0}/{1}.trk'.format(outdir, star.fout))
+        return tracks.atAge(track, solar_age, ['log_L', 'log_R', 'zx_surf']), None
+    except (Exception, SystemExit) as err:
+        return None, 'Run in {0} with Y = {1:.6f}, Z/X = {2:.6f}, a_mlt = {3:.5f} failed: {4}'.format(
+                     outdir, y, zx, a_mlt, err)
+
+def residuals(result, target_zx):
+    """ Offsets from the solar targets, with (Z/X)surf as a fractional error """
+    import numpy as np
+
+    log_L, log_R, zx = result
+    return np.array([log_L - solar_log_L, log_R - solar_log_R,
+                     (zx - target_zx)/target_zx])
+
+def calibrate(mix, guess = None, target_zx = None, eos = 'std',
+              nuclear_svals = 'SFII', turb_diff = 6.0, atm = 'phx',
+              steps = [0.005, 0.0005, 0.05], tol = 1.e-5, max_iter = 10,
+              method = 'newton', processes = None, save = True):
+    """ Solve for Y_init, (Z/X)_init and a_mlt that reproduce the Sun
+
+        Each iteration evolves the current guess and, for a Newton step,
+        one perturbed model per parameter concurrently, so that an
+        iteration costs a single parallel round of 1 Msun runs. With
+        method = 'broyden' the finite-difference Jacobian is only computed
+        once and then updated from successive iterates, which needs one
+        run per iteration instead of four.
+
+        Required Input:
+        ---------------
+            mix          ::    solar heavy element mixture to calibrate
+
+        Optional Input: (default)
+        ---------------
+            guess        ::    starting [Y, Z/X, a_mlt]. (current calibration
+                               for mix and physics, for mix, or GS98)
+            target_zx    ::    present-day solar (Z/X)surf. (mixture.solar_zx)
+            steps        ::    finite-difference steps in Y, Z/X and a_mlt.
+            tol          ::    convergence limit for all residuals. (1.e-5)
+            max_iter     ::    maximum number of iterations. (10)
+            method       ::    'newton' or 'broyden'. ('newton')
+            processes    ::    number of worker processes. (all cores)
+            save         ::    store the result for Model(a_mlt = 'solar')
+                               runs with the same mix, eos, nuclear_svals,
+                               turb_diff and atm. (True)
+
+        Returns:
+        --------
+        The calibration [X, Y, Z, a_mlt] as stored in mixture.solar_calib
+        under mixture.calibName(mix, eos, nuclear_svals, turb_diff, atm).
+
+        Raises:
+        -------
+        CalibrationError if any run fails or the solver does not converge
+        within max_iter iterations. Nothing is saved in either case.
+    """
+    import numpy as np
+    from multiprocessing import Pool
+
+    if method not in ['newton', 'broyden']:
+        raise ValueError('Unknown calibration method: {0}'.format(method))
+
+    if target_zx == None:
+        target_zx = mixture.solar_zx[mix]
+    name = mixture.calibName(mix, eos, nuclear_svals, turb_diff, atm)
+    if guess == None:
+        x, y, z, a_mlt = mixture.solar_calib.get(name, mixture.solar_calib.get(mix,
+                                                       mixture.solar_calib['GS98']))
+        guess = [y, z/x, a_mlt]
+
+    options = {'mixture': mix, 'eos': eos, 'nuclear_svals': nuclear_svals,
+               'turb_diff': turb_diff, 'atm': atm, 'age': solar_age}
+    workdir = ds.outdir + '/calib_{0}/'.format(name)
+
+    p     = np.array(guess, dtype = float)
+    steps = np.array(steps, dtype = float)
+    jac   = None
+    converged = False
+    pool  = Pool(processes = processes, initializer = mt.startWorker)
+    try:
+        for i in range(max_iter):
+            # current point plus perturbations when a new Jacobian is needed
+            points = [p]
+            if jac is None or method == 'newton':
+                points += [p + steps[j]*np.eye(3)[j] for j in range(3)]
+            jobs = [(tuple(pt), workdir + 'iter{:02.0f}_{:.0f}'.format(i, k), dict(options))
+                    for k, pt in enumerate(points)]
+            results = pool.map(evolveSolar, jobs)
+            errors  = [err for result, err in results if err != None]
+            if len(errors) > 0:
+                raise CalibrationError('\n'.join(errors))
+            results = [result for result, err in results]
+
+            r = residuals(results[0], target_zx)
+            print 'Calibration iteration {:.0f}: Y = {:.6f}, Z/X = {:.6f}, a_mlt = {:.5f}'.format(i, *p)
+            print '    dlog L = {:+.2e}, dlog R = {:+.2e}, d(Z/X)/(Z/X) = {:+.2e}'.format(*r)
+
+            if len(results) > 1:
+                jac = np.empty((3, 3))
+                for j in range(3):
+                    jac[:, j] = (residuals(results[j + 1], target_zx) - r)/steps[j]
+            elif i > 0:
+                # Broyden rank-one update from the previous step
+                dr  = r - r_old
+                jac = jac + np.outer(dr - jac.dot(dp), dp)/dp.dot(dp)
+
+            if np.all(np.abs(r) < tol):
+                converged = True
+                break
+
+            dp    = np.linalg.solve(jac, -r)
+            r_old = r
+            p     = p + dp
+    finally:
+        pool.close()
+        pool.join()
+
+    # only a point that was evolved and met tol is ever stored
+    if not converged:
+        raise CalibrationError('Solar calibration did not converge in {:.0f} iterations; '
+                               'last evaluated residuals {:+.2e}, {:+.2e}, {:+.2e}.'.format(max_iter, *r))
+
+    y, zx, a_mlt = p
+    x = (1.0 - y)/(1.0 + zx)
+    calib = [x, y, zx*x, a_mlt]
+    if save:
+        if not os.path.isdir(ds.calib):
+            os.makedirs(ds.calib)
+        mixture.saveCalibration(name, calib)
+    return calib
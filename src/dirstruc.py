@@ -16,6 +16,11 @@ nml     = base + 'nml/'
 zams    = base + 'zams/'
 poly    = base + 'poly/'
 prems   = base + 'prems/'
+calib   = base + 'calib/'
+cache   = base + 'cache/'
+
+# Prometheus textfiles for grid metrics, one per process (node-exporter textfile collector)
+metrics = base + 'metrics/'
 
 # data level directories
 atm     = data + 'atm/'
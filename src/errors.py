@@ -13,3 +13,11 @@ def valWarnAbove(var, val_max):
 def valErrMissing():
     print "ERROR: Missing a required input value."
     
+
+class AtmosphereError(ValueError):
+    """ Requested atmosphere boundary condition is not in the table grid """
+    pass
+
+class CalibrationError(RuntimeError):
+    """ Solar calibration run failed or the solver did not converge """
+    pass
@@ -0,0 +1,187 @@
+#
+#
+import os
+from . import metrics as mt
+
+# shell variables in the DMESTAR structure model (.last, fort.11) output.
+# variables beyond the end of this list are named 'var<N>' (zero-based N).
+last_columns = ['shell', 'mass', 'radius', 'log_P', 'log_T', 'log_rho',
+                'luminosity', 'x', 'z', 'del_rad', 'del_ad']
+
+# directory for binary sidecars; None for ds.cache, so that read-only or
+# shared grid directories are never written to
+cache_dir = None
+
+def isNumeric(token):
+    """ True for Fortran real/integer tokens, including D exponents """
+    try:
+        float(token.replace('D', 'E').replace('d', 'e'))
+        return True
+    except ValueError:
+        return False
+
+
+class LastModel(object):
+
+    def __init__(self, filename, cache = None, cache_dir = None):
+        """ Random access to the shells of a .last structure model
+
+            The first time a file is opened its shell records (the lines
+            made up of the most common number of numeric fields) are parsed
+            once into a binary sidecar, `cache`, and the non-shell lines are
+            kept as the header. By default the sidecar is
+            <name>.<path hash>.npy in cache_dir (module cache_dir, or
+            ds.cache), not next to the model. Later opens memory-map the
+            sidecar, so single variables or radial ranges are read without
+            touching the rest of the model. The sidecar is rebuilt whenever
+            the .last file is newer, and is written to a temporary file and
+            renamed so that concurrent openers never see a partial one. If
+            it cannot be written the model is parsed into memory instead.
+        """
+        import numpy as np
+
+        self.filename = filename
+        self.cache    = cache if cache != None else cacheName(filename, cache_dir)
+        self.hdr_file = os.path.splitext(self.cache)[0] + '.hdr'
+
+        if (not os.path.isfile(self.cache) or not os.path.isfile(self.hdr_file) or
+            os.path.getmtime(self.cache) < os.path.getmtime(filename)):
+            header, data = self.index()
+        else:
+            header, data = None, None
+
+        if data is None:
+            with open(self.hdr_file, 'r') as hdr:
+                header = hdr.read().splitlines()
+            data = np.load(self.cache, mmap_mode = 'r')
+        self.header  = header
+        self.data    = data
+        names        = last_columns[:self.data.shape[1]]
+        self.columns = names + ['var{:.0f}'.format(i) for i in range(len(names), self.data.shape[1])]
+
+    def index(self):
+        """ Parse the shell records once and write the binary sidecar
+
+            Returns (header, data) if the sidecar could not be written and
+            (None, None) otherwise.
+        """
+        import numpy as np
+        from collections import Counter
+
+        # shell records share the most common field count of numeric lines
+        with open(self.filename, 'r') as last:
+            lines = last.read().splitlines()
+        counts = Counter(len(line.split()) for line in lines
+                         if line.strip() and all(isNumeric(t) for t in line.split()))
+        if len(counts) == 0:
+            raise IOError('No shell records found in {0}.'.format(self.filename))
+        n_vars = counts.most_common(1)[0][0]
+
+        header, shells = [], []
+        for line in lines:
+            tokens = line.split()
+            if len(tokens) == n_vars and all(isNumeric(t) for t in tokens):
+                shells.append([float(t.replace('D', 'E').replace('d', 'e')) for t in tokens])
+            else:
+                header.append(line)
+
+        data = np.array(shells, dtype = np.float64)
+        try:
+            directory = os.path.dirname(self.cache)
+            if directory != '' and not os.path.isdir(directory):
+                os.makedirs(directory)
+            # header first: the sidecar only appears once both are complete
+            tmp = '{0}.{1:d}.tmp'.format(self.hdr_file, os.getpid())
+            with open(tmp, 'w') as hdr:
+                hdr.write('\n'.join(header) + '\n')
+            os.rename(tmp, self.hdr_file)
+            tmp = '{0}.{1:d}.tmp'.format(self.cache, os.getpid())
+            with open(tmp, 'wb') as npy:
+                np.save(npy, data)
+            os.rename(tmp, self.cache)
+        except (IOError, OSError):
+            print 'WARNING: Unable to write cache {0}. Reading model into memory.'.format(self.cache)
+            return header, data
+        return None, None
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def variable(self, name):
+        """ Memory-mapped view of one shell variable """
+        return self.data[:, self.columns.index(name)]
+
+    def radialRange(self, r_min, r_max, variables = None, radius = 'radius'):
+        """ Shells with r_min <= radius <= r_max, optionally for some variables only """
+        import numpy as np
+
+        r    = self.variable(radius)
+        rows = np.nonzero((r >= r_min) & (r <= r_max))[0]
+        if len(rows) == 0:
+            return self.data[0:0]
+        if rows[-1] - rows[0] + 1 == len(rows):
+            block = self.data[rows[0]:rows[-1] + 1]
+        else:
+            block = self.data[rows]
+        if variables == None:
+            return block
+        return block[:, [self.columns.index(name) for name in variables]]
+
+    def convBase(self, radius = 'radius'):
+        """ Radius at the base of the outer convection zone
+
+            Convection is taken to occur where del_rad > del_ad. Starting
+            from the surface shell, the zone extends inward until the first
+            radiative shell. Returns None if the surface is radiative.
+        """
+        import numpy as np
+
+        r   = np.asarray(self.variable(radius))
+        cz  = np.asarray(self.variable('del_rad') > self.variable('del_ad'))
+        out = np.argsort(r)[::-1]                   # surface first
+        if not cz[out[0]]:
+            return None
+        radiative = np.nonzero(~cz[out])[0]
+        if len(radiative) == 0:
+            return float(r[out[-1]])                # fully convective
+        return float(r[out[radiative[0] - 1]])
+
+def cacheName(filename, directory = None):
+    """ Sidecar path of a .last file, unique for its absolute path """
+    import hashlib
+    from . import dirstruc as ds
+
+    if directory == None:
+        directory = cache_dir if cache_dir != None else ds.cache
+    path = os.path.abspath(filename)
+    name = '{0}.{1}.npy'.format(os.path.basename(path), hashlib.sha1(path).hexdigest()[:12])
+    return os.path.join(directory, name)
+
+def convBase(filename):
+    """ Base of the outer convection zone for a single .last file """
+    return LastModel(filename).convBase()
+
+def startWorker(directory):
+    """ Pool initializer for batch(): sidecar directory and worker metrics """
+    global cache_dir
+
+    if directory != None:
+        cache_dir = directory
+    mt.startWorker()
+
+def batch(function, filenames, processes = None, cache_dir = None):
+    """ Apply function(filename) to many .last files in parallel
+
+        function must be defined at module level (e.g. lastmodel.convBase)
+        so that it can be sent to the worker processes. Sidecars opened by
+        the workers go to cache_dir (default: module cache_dir). Workers
+        export their own metrics (see metrics.startWorker).
+    """
+    from multiprocessing import Pool
+
+    pool = Pool(processes = processes, initializer = startWorker, initargs = (cache_dir,))
+    try:
+        return pool.map(function, filenames)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,255 @@
+#
+#
+import os
+import time
+import atexit
+import threading
+
+# run states tracked by the registry
+run_states = ['queued', 'running', 'completed', 'failed', 'aborted']
+
+
+class Metrics(object):
+
+    def __init__(self, prefix = 'dmestar', job = None):
+        """ Initialize new instance of Metrics
+
+            Grid-wide counters for DMESTAR runs. A single module-level
+            instance, `registry`, is updated by Model and can be exported
+            periodically to a Prometheus textfile (node-exporter textfile
+            collector format) or read in-process with snapshot().
+
+            Every process writes its own textfile, named and labelled
+            (grid_job) by `job`, or by its process id if no job name is
+            given, so that concurrent grid jobs do not overwrite each other.
+            A process-id textfile is removed by stop(), which start() also
+            registers to run at exit, so that dead processes are not
+            exported forever.
+        """
+        self.prefix    = prefix
+        self.job       = job
+        self.lock      = threading.Lock()
+        self.reset()
+
+        self.filename  = None
+        self.thread    = None
+        self.halt      = threading.Event()
+        self.atexit    = False
+
+    def reset(self):
+        """ Zero all counters, e.g. in a worker forked from a busy process """
+        with self.lock:
+            self.t_start   = time.time()
+            self.runs      = dict((state, 0) for state in run_states if state != 'running')
+            self.running   = 0
+            self.models    = 0
+            self.run_time  = 0.0
+            self.cpu_time  = 0.0
+            self.out_bytes = 0
+            self.setup     = {}
+
+    def queued(self, n = 1):
+        """ Record new runs waiting to be evolved """
+        with self.lock:
+            self.runs['queued'] += n
+
+    def started(self):
+        """ Move a run from queued to running """
+        with self.lock:
+            self.runs['queued'] = max(self.runs['queued'] - 1, 0)
+            self.running += 1
+
+    def finished(self, state, wall_time = 0.0, cpu_time = 0.0,
+                 n_models = 0, out_bytes = 0):
+        """ Record the outcome of a run: 'completed', 'failed' or 'aborted' """
+        if state not in run_states[2:]:
+            raise ValueError('Unknown final run state: {0}'.format(state))
+        with self.lock:
+            if self.running > 0:
+                self.running -= 1
+            else:
+                # run never reached evolve(), e.g. aborted during setup
+                self.runs['queued'] = max(self.runs['queued'] - 1, 0)
+            self.runs[state] += 1
+            self.run_time  += wall_time
+            self.cpu_time  += cpu_time
+            self.models    += n_models
+            self.out_bytes += out_bytes
+
+    def observeSetup(self, phase, seconds):
+        """ Add the latency of a single construct() phase """
+        with self.lock:
+            total, count = self.setup.get(phase, (0.0, 0))
+            self.setup[phase] = (total + seconds, count + 1)
+
+    def snapshot(self):
+        """ Return a copy of all current metric values as a dictionary """
+        with self.lock:
+            if self.run_time > 0.0:
+                rate = self.models/self.run_time
+            else:
+                rate = 0.0
+            return {'runs':              dict(self.runs, running = self.running),
+                    'models':            self.models,
+                    'models_per_second': rate,
+                    'run_seconds':       self.run_time,
+                    'cpu_seconds':       self.cpu_time,
+                    'output_bytes':      self.out_bytes,
+                    'setup_seconds':     dict(self.setup),
+                    'uptime_seconds':    time.time() - self.t_start}
+
+    def jobName(self):
+        """ Job name, or the current process id (also in Pool workers) """
+        if self.job == None:
+            return str(os.getpid())
+        return str(self.job)
+
+    def textfile(self):
+        """ Format current metric values in Prometheus text exposition format """
+        snap = self.snapshot()
+        p    = self.prefix
+        job  = 'grid_job="{0}"'.format(self.jobName())
+
+        lines = []
+        lines.append('# HELP {0}_runs Number of runs currently in each state.'.format(p))
+        lines.append('# TYPE {0}_runs gauge'.format(p))
+        for state in ['queued', 'running']:
+            lines.append('{0}_runs{{{1},state="{2}"}} {3:d}'.format(p, job, state, snap['runs'][state]))
+
+        lines.append('# HELP {0}_runs_total Number of runs that have finished.'.format(p))
+        lines.append('# TYPE {0}_runs_total counter'.format(p))
+        for state in run_states[2:]:
+            lines.append('{0}_runs_total{{{1},state="{2}"}} {3:d}'.format(p, job, state, snap['runs'][state]))
+
+        lines.append('# HELP {0}_models_total Evolution models (time steps) written.'.format(p))
+        lines.append('# TYPE {0}_models_total counter'.format(p))
+        lines.append('{0}_models_total{{{1}}} {2:d}'.format(p, job, snap['models']))
+
+        lines.append('# HELP {0}_models_per_second Models per second of run wall time.'.format(p))
+        lines.append('# TYPE {0}_models_per_second gauge'.format(p))
+        lines.append('{0}_models_per_second{{{1}}} {2:.6g}'.format(p, job, snap['models_per_second']))
+
+        lines.append('# HELP {0}_setup_seconds Latency of construct() phases.'.format(p))
+        lines.append('# TYPE {0}_setup_seconds summary'.format(p))
+        for phase in sorted(snap['setup_seconds']):
+            total, count = snap['setup_seconds'][phase]
+            lines.append('{0}_setup_seconds_sum{{{1},phase="{2}"}} {3:.6g}'.format(p, job, phase, total))
+            lines.append('{0}_setup_seconds_count{{{1},phase="{2}"}} {3:d}'.format(p, job, phase, count))
+
+        lines.append('# HELP {0}_subprocess_cpu_seconds_total CPU time of DMESTAR subprocesses.'.format(p))
+        lines.append('# TYPE {0}_subprocess_cpu_seconds_total counter'.format(p))
+        lines.append('{0}_subprocess_cpu_seconds_total{{{1}}} {2:.6g}'.format(p, job, snap['cpu_seconds']))
+
+        lines.append('# HELP {0}_output_bytes_total Bytes written to model output files.'.format(p))
+        lines.append('# TYPE {0}_output_bytes_total counter'.format(p))
+        lines.append('{0}_output_bytes_total{{{1}}} {2:d}'.format(p, job, snap['output_bytes']))
+
+        return '\n'.join(lines) + '\n'
+
+    def path(self, filename = None):
+        """ Textfile name: filename, the one given to start(), or <prefix>_<job>.prom in ds.metrics """
+        from . import dirstruc as ds
+
+        if filename == None:
+            filename = self.filename
+        if filename == None:
+            filename = ds.metrics + '{0}_{1}.prom'.format(self.prefix, self.jobName())
+        return filename
+
+    def export(self, filename = None):
+        """ Atomically write the textfile so the collector never reads a partial file
+
+            The directory of the textfile (see path()) is created if
+            necessary.
+        """
+        filename  = self.path(filename)
+        directory = os.path.dirname(filename)
+        if directory != '' and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created concurrently by another process
+                if not os.path.isdir(directory):
+                    raise
+        tmp = '{0}.{1:d}.tmp'.format(filename, os.getpid())
+        with open(tmp, 'w') as prom:
+            prom.write(self.textfile())
+        os.rename(tmp, filename)
+
+    def start(self, filename = None, interval = 15.0):
+        """ Export the textfile every `interval` seconds from a daemon thread """
+        if self.thread != None and self.thread.is_alive():
+            return
+        self.filename = filename
+        self.halt.clear()
+        if not self.atexit:
+            atexit.register(self.stop)
+            self.atexit = True
+
+        def loop():
+            while not self.halt.is_set():
+                try:
+                    self.export(filename)
+                except (IOError, OSError):
+                    print "WARNING: Unable to write metrics textfile."
+                self.halt.wait(interval)
+
+        self.thread = threading.Thread(target = loop, name = 'dmestar-metrics')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, filename = None, keep = None):
+        """ Stop periodic export and write a final textfile or remove it
+
+            By default (keep = None) the final textfile is kept for a named
+            job, which the next run with that name overwrites, and removed
+            for a process-id textfile, which no later process would replace.
+        """
+        self.halt.set()
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+        if keep == None:
+            keep = self.job != None
+        if keep:
+            self.export(filename)
+        else:
+            try:
+                os.remove(self.path(filename))
+            except OSError:
+                pass
+
+
+def startWorker(interval = 15.0):
+    """ Pool initializer exporting the metrics of a worker process
+
+        Models created in pool workers update the worker's copy of
+        registry, which the parent never exports. The worker starts from
+        zeroed counters, writes its own textfile (job name suffixed with
+        the worker's process id) and removes it when the worker exits.
+    """
+    from multiprocessing import util
+
+    registry.reset()
+    if registry.job != None:
+        registry.job = '{0}_{1:d}'.format(registry.job, os.getpid())
+    registry.thread = None
+    registry.start(interval = interval)
+    # pool workers leave through os._exit, which skips atexit
+    util.Finalize(registry, registry.stop, exitpriority = 10)
+
+def countModels(filename):
+    """ Number of evolution models (non-comment lines) in a .trk file """
+    try:
+        with open(filename, 'r') as trk:
+            return sum(1 for line in trk if line.strip() and not line.startswith('#'))
+    except IOError:
+        return 0
+
+def outputBytes(fout, directory = './'):
+    """ Total size of all output files sharing the root name `fout` """
+    import glob
+    return sum(os.path.getsize(f) for f in glob.glob(directory + fout + '.*'))
+
+# grid-wide registry shared by all Model instances in this process
+registry = Metrics()
@@ -12,6 +12,23 @@ z_abundance = {'GS98'  : [3.0e-5, 0.17208, 0.00150, 0.050410, 0.0,    0.468020,
                'GAS07' : [3.0e-5, 0.17533, 0.00177, 0.050696, 0.0,    0.439279, 0.0, 0.0],
                'AGSS09': [3.0e-5, 0.17647, 0.00214, 0.052174, 1.3e-4, 0.431654, 0.0, 0.0]}
 
+# target present-day solar surface (Z/X) for each mixture
+solar_zx    = {'GS98'  : 0.0229,
+               'GAS07' : 0.0165,
+               'AGSS09': 0.0181}
+
+def calibName(mix, eos = 'std', nuclear_svals = 'SFII', turb_diff = 6.0, atm = 'phx'):
+    """ Key of the solar calibration for a mixture and input physics
+    
+        Calibrations with the default physics, which the built-in entries
+        of solar_calib were made with, are keyed by the mixture alone
+        (e.g. 'GS98'); others by mixture and physics, for example
+        'GS98_opal_SFII_td6.00_phx'.
+    """
+    if (eos, nuclear_svals, float(turb_diff), atm) == ('std', 'SFII', 6.0, 'phx'):
+        return mix
+    return '{0}_{1}_{2}_td{3:.2f}_{4}'.format(mix, eos, nuclear_svals, float(turb_diff), atm)
+
 def getSolar(mix):
     return solar_calib[mix]
     
@@ -33,12 +50,14 @@ def getFerg05Data(mix, afe):
         afe_ext = ''   
     return ['{:s}{:s}.{:.0f}.tron'.format(mix.lower(), afe_ext, z) for z in z_vals]
 
-def setAbundances(x, y, z, mix, feh, afe, y_prim):
-    """ Set mass fractions X, Y, and Z """
+def setAbundances(x, y, z, mix, feh, afe, y_prim, calib = None):
+    """ Set mass fractions X, Y, and Z (calib: solar_calib key, default mix) """
     from math import log10
     
     # get solar X, Y, and Z
-    solar = solar_calib[mix]
+    if calib == None:
+        calib = mix
+    solar = solar_calib[calib]
     
     # readjust total metallicity for alpha enhancement (Salaris & Cassisi 2005)
     meh = feh + log10(0.694*10.**afe + 0.306)
@@ -63,3 +82,45 @@ def setAbundances(x, y, z, mix, feh, afe, y_prim):
         pass
     
     return x, y, z
+
+def loadCalibrations(filename = None):
+    """ Add solar calibrations written by calibrate.py to solar_calib """
+    from . import dirstruc as ds
+    
+    if filename == None:
+        filename = ds.calib + 'solar_calib.dat'
+    try:
+        with open(filename, 'r') as calib:
+            for line in calib:
+                if line.strip() == '' or line.startswith('#'):
+                    continue
+                entry = line.split()
+                solar_calib[entry[0]] = [float(val) for val in entry[1:5]]
+    except IOError:
+        pass
+
+def saveCalibration(name, calib, filename = None):
+    """ Store a solar calibration [X, Y, Z, a_mlt] under name (see calibName) """
+    from . import dirstruc as ds
+    
+    if filename == None:
+        filename = ds.calib + 'solar_calib.dat'
+    
+    # keep the latest calibration for each mixture and physics
+    entries = {}
+    try:
+        with open(filename, 'r') as old:
+            for line in old:
+                if line.strip() != '' and not line.startswith('#'):
+                    entries[line.split()[0]] = line
+    except IOError:
+        pass
+    entries[name] = '{0:8s} {1:.8f} {2:.8f} {3:.8f} {4:.5f}\n'.format(name, *calib)
+    
+    with open(filename, 'w') as new:
+        new.write('# calib    X           Y           Z           a_mlt\n')
+        for key in sorted(entries):
+            new.write(entries[key])
+    solar_calib[name] = list(calib)
+
+loadCalibrations()
@@ -0,0 +1,176 @@
+#
+#
+# Make-like planning of grid runs from recorded run dependencies.
+#
+import os
+import json
+from . import dirstruc as ds
+from . import mixture
+from . import writenml as wn
+
+# Model attributes that determine the result of a run
+run_params = ['mass', 'feh', 'afe', 'x', 'y', 'z', 'y_prim', 'mix', 'atm', 'tau',
+              'a_mlt', 'N_models', 'final_age', 'turb_diff', 'EOS', 'nuclearS',
+              'b_field', 'b_surf', 'b_pert_age', 'b_gamma', 'chi_f', 'fc_tach',
+              'eq_lambda', 'b_rad_prof', 'dynamo', 'b_field_ramp', 'start_model']
+
+# extension of the dependency record written next to the model output
+extension = '.deps'
+
+# content hashes computed in this process, keyed by (path, mtime, size)
+hashes = {}
+
+def fileHash(filepath):
+    """ SHA-1 of a file, computed once per (path, mtime, size) """
+    import hashlib
+
+    stat = os.stat(filepath)
+    key  = (filepath, stat.st_mtime, stat.st_size)
+    if key not in hashes:
+        sha1 = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), ''):
+                sha1.update(block)
+        hashes[key] = sha1.hexdigest()
+    return hashes[key]
+
+def fileState(filepath, content = True):
+    """ Modification time, size and (optionally) hash of a file, or None if missing """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    state = {'mtime': stat.st_mtime, 'size': stat.st_size}
+    if content:
+        state['sha1'] = fileHash(filepath)
+    return state
+
+def dependencies(star):
+    """ Every file a run reads: templates, data tables and executables
+
+        The model must have its abundances, atmosphere and starting model
+        set (setAbundances(), setAtmosphere() and setStartModel()).
+    """
+    files = [path for unit, path in star.inputFiles()]
+    files.append(wn.physTemplate(star.mass))
+    files.append(ds.opal + mixture.getOpalBinary(star.mix, star.afe))
+    files += [ds.ferg + f for f in mixture.getFerg05Data(star.mix, star.afe)]
+    files.append(star.binary)
+    if star.start == None:
+        files.append(ds.mach + 'newpoly')
+    return sorted(set(files))
+
+def parameters(star):
+    return dict((key, getattr(star, key)) for key in run_params)
+
+def record(star, directory = ''):
+    """ Write the dependency record of a completed run to <fout>.deps
+
+        Called by Model.evolve() in the scratch directory, so the record
+        is moved to the output directory along with the other output.
+    """
+    deps = dict((f, fileState(f)) for f in dependencies(star))
+    with open(os.path.join(directory, star.fout + extension), 'w') as out:
+        json.dump({'params': parameters(star), 'files': deps}, out, indent = 1, sort_keys = True)
+
+def prepare(star):
+    """ Resolve everything needed to plan a run without building it """
+    star.setAbundances()
+    star.setStartModel()
+    star.setAtmosphere()
+    star.fout = star.outputName()
+
+def outdated(star):
+    """ Reasons why a run must be (re)executed; an empty list if it is up to date """
+    prepare(star)
+    try:
+        with open(os.path.join(star.outdir, star.fout + extension), 'r') as deps:
+            recorded = json.load(deps)
+    except IOError:
+        return ['no record of a completed run']
+
+    reasons = []
+    old = recorded['params']
+    for key, value in parameters(star).items():
+        if old.get(key) != value:
+            reasons.append('parameter {0}: {1} -> {2}'.format(key, old.get(key), value))
+
+    old = recorded['files']
+    for f in dependencies(star):
+        if f not in old:
+            reasons.append('new input {0}'.format(f))
+            continue
+        now = fileState(f, content = False)
+        if now == None:
+            if old[f] != None:
+                reasons.append('missing input {0}'.format(f))
+        elif old[f] == None:
+            reasons.append('new input {0}'.format(f))
+        elif (now['mtime'], now['size']) != (old[f]['mtime'], old[f]['size']):
+            # touched files with unchanged content do not force a rerun
+            if fileHash(f) != old[f]['sha1']:
+                reasons.append('modified input {0}'.format(f))
+    return reasons
+
+def models(grid):
+    """ Model instances for a grid of Models or dictionaries of Model arguments
+
+        Models are created with queue = False; runs are counted as queued
+        only once they are scheduled.
+    """
+    from ..model import Model
+
+    return [Model(queue = False, **star) if isinstance(star, dict) else star
+            for star in grid]
+
+def plan(grid):
+    """ The minimal set of runs needed to bring a grid up to date
+
+        grid is a list of Model instances, or of dictionaries of Model
+        keyword arguments. Returns a list of (model, reasons) pairs for
+        the runs that are new or whose parameters or inputs changed since
+        they were recorded. Pass dictionaries (or Models created with
+        queue = False) so that up-to-date runs are not counted as queued.
+    """
+    from . import metrics as mt
+
+    todo = []
+    for star in models(grid):
+        reasons = outdated(star)
+        if len(reasons) > 0:
+            if not star.queue:
+                star.queue = True
+                mt.registry.queued()
+            todo.append((star, reasons))
+    print 'Grid plan: {0:.0f} of {1:.0f} runs to execute.'.format(len(todo), len(grid))
+    return todo
+
+def adopt(grid):
+    """ Record the runs of an existing grid as up to date
+
+        Writes a dependency record, using the current inputs, for every run
+        whose track (<fout>.trk) is already in its output directory but has
+        no record yet, e.g. a grid evolved before records were kept. The
+        next plan() then only schedules runs that are missing or change
+        afterwards. Returns the names (fout) of the adopted runs.
+    """
+    adopted = []
+    for star in models(grid):
+        prepare(star)
+        if not os.path.isfile(os.path.join(star.outdir, star.fout + '.trk')):
+            continue
+        if os.path.isfile(os.path.join(star.outdir, star.fout + extension)):
+            continue
+        record(star, star.outdir)
+        adopted.append(star.fout)
+    print 'Grid adopt: recorded {0:.0f} existing runs of {1:.0f}.'.format(len(adopted), len(grid))
+    return adopted
+
+def update(grid):
+    """ Plan the grid and evolve only the runs that are out of date """
+    todo = plan(grid)
+    for star, reasons in todo:
+        print '{0}: {1}'.format(star.fout, '; '.join(reasons))
+        star.construct()
+        star.evolve()
+    return [star for star, reasons in todo]
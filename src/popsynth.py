@@ -0,0 +1,202 @@
+#
+#
+from .trackstore import TrackStore
+
+# initial mass functions, dN/dm (unnormalized)
+def salpeter(m):
+    """ Salpeter (1955) """
+    return m**-2.35
+
+def kroupa(m):
+    """ Kroupa (2001), continuous across the break at 0.5 Msun """
+    import numpy as np
+    return np.where(m < 0.5, m**-1.3, 0.5*m**-2.3)
+
+def chabrier(m):
+    """ Chabrier (2003) single-star IMF """
+    import numpy as np
+    low  = 0.158*np.exp(-(np.log10(m) - np.log10(0.079))**2/(2.*0.69**2))
+    high = 0.0443*m**-1.3
+    return np.where(m <= 1.0, low, high)/m
+
+imfs = {'salpeter': salpeter, 'kroupa': kroupa, 'chabrier': chabrier}
+
+def sampleTabulated(pdf, lo, hi, n, rng, log = False, n_tab = 10000):
+    """ Draw n values from an arbitrary density on [lo, hi] by inverse CDF """
+    import numpy as np
+
+    if lo == hi:
+        return np.repeat(float(lo), n)
+    if log:
+        x = np.logspace(np.log10(lo), np.log10(hi), n_tab)
+    else:
+        x = np.linspace(lo, hi, n_tab)
+    p   = pdf(x)
+    cdf = np.concatenate([[0.], np.cumsum(0.5*(p[1:] + p[:-1])*np.diff(x))])
+    return np.interp(rng.uniform(0., cdf[-1], n), cdf, x)
+
+
+class Population(object):
+
+    def __init__(self, store, n_age = 400, select = {},
+                 quantities = ['log_L', 'log_Teff', 'log_R', 'log_g']):
+        """ Initialize new instance of Population
+
+            Resamples every track in a TrackStore (or a store file name)
+            onto a common grid in fractional log lifetime,
+                phase = (log t - log t_first)/(log t_last - log t_first),
+            from 0 at the first to 1 at the last model of the track, and
+            arranges them on a regular ([Fe/H], b_surf, mass, phase) grid, so
+            that the properties of any number of stars are found by
+            vectorized multilinear interpolation. Neighbouring tracks are
+            thus combined at the same stage of their own evolution rather
+            than at the same age, and a star is NaN only once it is past its
+            own interpolated lifetime, not when a neighbouring track has
+            ended. Tracks that stop at different evolutionary stages (e.g.
+            at a common final_age) are still matched by their end points.
+            Grid dimensions with a single value (e.g. no magnetic models)
+            are dropped. Grid cells without a track are NaN.
+
+            Optional Input: (default)
+            ---------------
+                n_age        ::    number of phase grid points. (400)
+                select       ::    file-name properties that all tracks must
+                                   match, e.g. {'mix': 'GS98', 'afe': 0.0}.
+                                   must leave at most one track per
+                                   ([Fe/H], b_surf, mass); ValueError
+                                   otherwise.
+                quantities   ::    track columns to evaluate.
+        """
+        import numpy as np
+        from scipy.interpolate import RegularGridInterpolator
+
+        if not isinstance(store, TrackStore):
+            store = TrackStore(store)
+        names = store.select(**select)
+        if len(names) == 0:
+            raise ValueError('No tracks in the store match {0}.'.format(select))
+
+        props  = [store.props[name] for name in names]
+        values = dict((key, np.unique([p[key] for p in props]))
+                      for key in ['feh', 'b_surf', 'mass'])
+
+        # each grid cell must hold a single track
+        cells = {}
+        for name, p in zip(names, props):
+            cell = (p['feh'], p['b_surf'], p['mass'])
+            if cell in cells:
+                raise ValueError('Tracks {0} and {1} share [Fe/H] = {2:+.2f}, b_surf = {3:.0f} G, '
+                                 'M = {4:.3f}; narrow select (e.g. mix, afe, a_mlt, '
+                                 'eq_lambda).'.format(cells[cell], name, *cell))
+            cells[cell] = name
+
+        # age range spanned by the selected tracks only
+        ages = np.concatenate([store.track(name)['age'] for name in names])
+        ages = ages[ages > 0.0]
+        self.log_age = np.linspace(np.log10(ages.min()), np.log10(ages.max()), n_age)
+        self.phase   = np.linspace(0.0, 1.0, n_age)
+
+        # log age is stored as an extra quantity to map phase back to age
+        grid = np.full((len(values['feh']), len(values['b_surf']), len(values['mass']),
+                        n_age, len(quantities) + 1), np.nan)
+        for name, p in zip(names, props):
+            track = store.track(name)
+            keep  = track['age'] > 0.0
+            log_t = np.log10(track['age'][keep])
+            phase = (log_t - log_t[0])/max(log_t[-1] - log_t[0], 1.e-10)
+            i = [np.searchsorted(values[key], p[key]) for key in ['feh', 'b_surf', 'mass']]
+            for q, col in enumerate(quantities):
+                grid[i[0], i[1], i[2], :, q] = np.interp(self.phase, phase, track[col][keep])
+            grid[i[0], i[1], i[2], :, -1] = log_t[0] + self.phase*(log_t[-1] - log_t[0])
+
+        # drop dimensions with a single grid value
+        self.values = values
+        self.axes   = [key for key in ['feh', 'b_surf', 'mass'] if len(values[key]) > 1]
+        grid = grid.reshape([len(values[key]) for key in ['feh', 'b_surf', 'mass'] if len(values[key]) > 1] +
+                            [n_age, len(quantities) + 1])
+
+        self.quantities = list(quantities)
+        self.interp = RegularGridInterpolator([values[key] for key in self.axes] + [self.phase],
+                                              grid, bounds_error = False, fill_value = np.nan)
+
+    def evaluate(self, mass, age, feh, b_surf = 0.0):
+        """ Interpolate all quantities for arrays of stars (age in yr)
+
+            log age is linear in phase on every track, and therefore also
+            at any interpolated (feh, b_surf, mass), so the phase of each
+            star follows from its interpolated first and last log age.
+            Stars younger than the start or older than the end of their
+            own interpolated track are NaN.
+        """
+        import numpy as np
+
+        stars  = {'feh': feh, 'b_surf': b_surf, 'mass': mass}
+        log_t  = np.log10(np.atleast_1d(age).astype(float))
+        n      = len(log_t)
+        coords = [np.broadcast_to(stars[key], n) for key in self.axes]
+
+        first = self.interp(np.column_stack(coords + [np.zeros(n)]))[:, -1]
+        last  = self.interp(np.column_stack(coords + [np.ones(n)]))[:, -1]
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            phase = (log_t - first)/(last - first)
+            alive = (phase >= 0.0) & (phase <= 1.0)
+        phase = np.where(alive, phase, 0.0)
+
+        result = self.interp(np.column_stack(coords + [phase]))
+        result[~alive] = np.nan
+        return dict((col, result[:, q]) for q, col in enumerate(self.quantities))
+
+    def sample(self, n, imf = 'kroupa', sfh = None, age_range = None,
+               mdf = (0.0, 0.0), b_surf = 0.0, rng = None):
+        """ Draw masses, ages, [Fe/H] and b_surf for n stars
+
+            Masses follow `imf` (a name in imfs or a function dN/dm) over
+            the mass range of the grid. Ages follow the star-formation
+            history `sfh(age)` over age_range (constant by default, a
+            single burst if both limits are equal). [Fe/H] is Gaussian with
+            (mean, sigma) = mdf, clipped to the grid. b_surf is either a
+            single value or a function returning n values given rng.
+        """
+        import numpy as np
+
+        if rng == None:
+            rng = np.random.RandomState()
+        if not callable(imf):
+            imf = imfs[imf]
+        if age_range == None:
+            age_range = (10.**self.log_age[0], 10.**self.log_age[-1])
+        if sfh == None:
+            sfh = lambda t: np.ones_like(t)
+
+        masses = self.values['mass']
+        stars  = {'mass': sampleTabulated(imf, masses[0], masses[-1], n, rng, log = True),
+                  'age' : sampleTabulated(sfh, age_range[0], age_range[1], n, rng)}
+
+        feh = self.values['feh']
+        stars['feh'] = np.clip(mdf[0] + mdf[1]*rng.standard_normal(n), feh[0], feh[-1])
+        if callable(b_surf):
+            stars['b_surf'] = np.asarray(b_surf(n, rng), dtype = float)
+        else:
+            stars['b_surf'] = np.repeat(float(b_surf), n)
+        return stars
+
+    def synthesize(self, n_stars, chunk_size = 1000000, seed = None, **kwargs):
+        """ Generate a population in chunks of at most chunk_size stars
+
+            A generator, so memory use is set by chunk_size rather than
+            n_stars. Each chunk is a dictionary with the sampled mass, age,
+            feh and b_surf plus every interpolated quantity; stars that
+            have evolved off the end of their track have NaN quantities.
+            Keyword arguments are passed to sample().
+        """
+        import numpy as np
+
+        rng = np.random.RandomState(seed)
+        done = 0
+        while done < n_stars:
+            n = min(chunk_size, n_stars - done)
+            stars = self.sample(n, rng = rng, **kwargs)
+            stars.update(self.evaluate(stars['mass'], stars['age'],
+                                       stars['feh'], stars['b_surf']))
+            done += n
+            yield stars
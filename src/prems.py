@@ -0,0 +1,124 @@
+#
+#
+# Library of stored pre-main-sequence starting models.
+#
+import os
+import json
+import glob
+import shutil
+from . import dirstruc as ds
+
+# completed runs ending at or before this age (yr) are added to the library
+max_age = 1.0e8
+
+# Fortran unit from which DMESTAR reads its starting model
+start_unit = 'fort.12'
+
+# largest accepted offsets between a stored model and the requested star
+max_dlog_mass = 0.1
+max_dfeh      = 0.5
+max_dy        = 0.02
+
+# input physics (Model attributes) a stored model must share with the run
+# it seeds; a magnetic pre-MS model must never seed a non-magnetic run
+physics = ['EOS', 'nuclearS', 'turb_diff', 'y_prim', 'atm', 'b_field']
+
+def runPhysics(model):
+    """ Input physics of a model that a library entry must match """
+    return dict((key, getattr(model, key)) for key in physics)
+
+def physicsName(phys):
+    """ File name tag for the input physics, e.g. 'std_SFII_td6.00_yp0.2480_phx_Boff' """
+    return '{EOS}_{nuclearS}_td{turb_diff:.2f}_yp{y_prim:.4f}_{atm}_B{b_field}'.format(**phys)
+
+# extension of the index entry written next to each stored model
+extension = '.json'
+
+def readIndex():
+    """ List of stored models (dictionaries); empty if there is no library yet
+
+        Each model has its own index entry (<model>.last.json), so runs
+        storing models in parallel never overwrite each other's entries.
+    """
+    entries = []
+    for filename in sorted(glob.glob(ds.prems + '*.last' + extension)):
+        try:
+            with open(filename, 'r') as idx:
+                entries.append(json.load(idx))
+        except (IOError, ValueError):
+            continue
+    return entries
+
+def store(model):
+    """ Add the final (.last) model of a completed run to the library
+
+        Called by Model.evolve() from the scratch directory, before the
+        output files are moved to their final location.
+    """
+    if not os.path.isdir(ds.prems):
+        os.makedirs(ds.prems)
+    # runs differing only in physics or Y must not replace each other
+    phys     = runPhysics(model)
+    filename = '{0}_{1}_y{2:.4f}_t{3:.2e}.last'.format(model.fout, physicsName(phys),
+                                                     model.y, model.final_age)
+    shutil.copy('{0}.last'.format(model.fout), ds.prems + filename)
+
+    entry = dict(phys, file = filename, mass = model.mass, feh = model.feh,
+                 afe = model.afe, mix = model.mix, x = model.x, y = model.y,
+                 z = model.z, a_mlt = model.a_mlt, age = model.final_age)
+    tmp = '{0}{1}.{2:d}.tmp'.format(ds.prems, filename, os.getpid())
+    with open(tmp, 'w') as idx:
+        json.dump(entry, idx, indent = 1)
+    os.rename(tmp, ds.prems + filename + extension)
+    print 'Stored pre-MS model: {0}'.format(filename)
+
+def nearest(mass, feh, afe, mix, age = None, y = None, phys = {}):
+    """ Closest stored model with the same mixture, [a/Fe] and physics
+
+        Distance is measured in log mass and [Fe/H] (weighted 0.05 dex :
+        0.1 dex). Models at or beyond `age` (yr), e.g. the final age of
+        the run, models whose helium differs from `y` by more than max_dy
+        and models whose input physics differ from `phys` (see
+        runPhysics()) are skipped. Returns the library entry with its full
+        path under 'path', or None if nothing lies within max_dlog_mass
+        and max_dfeh.
+    """
+    from math import log10
+
+    def same(a, b):
+        if isinstance(b, float) and isinstance(a, (int, float)):
+            return abs(a - b) < 1.e-6
+        return a == b
+
+    best, best_dist = None, None
+    for entry in readIndex():
+        if entry['mix'] != mix or abs(entry['afe'] - afe) > 1.e-6:
+            continue
+        if age != None and entry['age'] >= age:
+            continue
+        if not all(same(entry.get(key), value) for key, value in phys.items()):
+            continue
+        if y != None and abs(entry.get('y', -1.0) - y) > max_dy:
+            continue
+        dlog_m = log10(mass/entry['mass'])
+        dfeh   = feh - entry['feh']
+        if abs(dlog_m) > max_dlog_mass or abs(dfeh) > max_dfeh:
+            continue
+        dist = (dlog_m/0.05)**2 + (dfeh/0.1)**2
+        if best_dist == None or dist < best_dist:
+            best, best_dist = entry, dist
+    if best != None:
+        best = dict(best, path = ds.prems + best['file'])
+    return best
+
+def build(masses, feh = 0.0, age = max_age, **kwargs):
+    """ Populate the library by evolving each mass up to `age` from a polytrope
+
+        Additional keyword arguments are passed to Model.
+    """
+    from ..model import Model
+
+    for mass in masses:
+        star = Model(mass, feh, final_age = age, start_model = 'poly', **kwargs)
+        star.construct()
+        star.evolve()
@@ -0,0 +1,184 @@
+#
+#
+from . import tracks
+
+# numeric properties recovered from track file names (see tracks.parseName)
+name_props = ['mass', 'feh', 'afe', 'a_mlt', 'b_surf', 'eq_lambda']
+
+
+class TrackIndex(object):
+
+    def __init__(self, points, mass, age, weight, columns, scale):
+        """ Initialize new instance of TrackIndex
+
+            A KD-tree over every point of every track in a grid, used to
+            infer masses and ages of observed stars. Coordinates are divided
+            by `scale` before indexing so that distances are comparable
+            across columns. Use TrackIndex.build() to create an index from
+            a grid directory and TrackIndex.load() to reload a saved one.
+
+            Required Input:
+            ---------------
+                points       ::    (N, D) array of track point coordinates
+                mass         ::    (N,) model mass (in solar units)
+                age          ::    (N,) model age (in yr)
+                weight       ::    (N,) prior weight of each point, the time
+                                   step it represents
+                columns      ::    names of the D coordinates
+                scale        ::    (D,) normalization of each coordinate
+        """
+        import numpy as np
+        from scipy.spatial import cKDTree
+
+        self.points  = np.asarray(points, dtype = float)
+        self.mass    = np.asarray(mass,   dtype = float)
+        self.age     = np.asarray(age,    dtype = float)
+        self.weight  = np.asarray(weight, dtype = float)
+        self.columns = list(columns)
+        self.scale   = np.asarray(scale,  dtype = float)
+        self.tree    = cKDTree(self.points/self.scale)
+
+    @classmethod
+    def build(cls, directory = None, columns = ['log_Teff', 'log_L', 'feh'],
+              scale = None):
+        """ Index all .trk files in a grid directory (ds.outdir)
+
+            Columns may be any track column or any property recovered from
+            the file name (e.g. 'feh', 'afe', 'b_surf'). By default each
+            coordinate is scaled by its standard deviation over the grid.
+            Raises ValueError for a column that is neither.
+        """
+        import re
+        import numpy as np
+
+        track_cols = tracks.trk_columns + ['zx_surf']
+        unknown = [col for col in columns if col not in track_cols + name_props
+                   and re.match(r'^col\d+$', col) == None]
+        if len(unknown) > 0:
+            raise ValueError('Unknown index column(s) {0}: not a track column {1} or a file-name '
+                             'property {2}.'.format(', '.join(unknown), track_cols, name_props))
+
+        points, mass, age, weight = [], [], [], []
+        for filename in tracks.findTracks(directory):
+            props = tracks.parseName(filename)
+            if props == None:
+                continue
+            track = tracks.readTrack(filename)
+            n_pts = len(track['age'])
+
+            missing = [col for col in columns if col not in track and col not in props]
+            if len(missing) > 0:
+                raise ValueError('Columns {0} not found in {1}.'.format(missing, filename))
+
+            coords = []
+            for col in columns:
+                if col in track:
+                    coords.append(track[col])
+                else:
+                    coords.append(np.repeat(props[col], n_pts))
+            points.append(np.column_stack(coords))
+            mass.append(np.repeat(props['mass'], n_pts))
+            age.append(track['age'])
+            weight.append(np.gradient(track['age']) if n_pts > 1 else np.ones(1))
+
+        if len(points) == 0:
+            raise IOError('No evolution tracks found to index.')
+
+        points = np.concatenate(points)
+        if scale is None:
+            scale = points.std(axis = 0)
+            scale[scale == 0.0] = 1.0
+        return cls(points, np.concatenate(mass), np.concatenate(age),
+                   np.abs(np.concatenate(weight)), columns, scale)
+
+    def save(self, filename):
+        """ Persist the index; the tree is rebuilt by load() """
+        import numpy as np
+        np.savez(filename, points = self.points, mass = self.mass, age = self.age,
+                 weight = self.weight, columns = np.array(self.columns),
+                 scale = self.scale)
+
+    @classmethod
+    def load(cls, filename):
+        """ Reload an index written by save() """
+        import numpy as np
+        data = np.load(filename)
+        return cls(data['points'], data['mass'], data['age'], data['weight'],
+                   [str(col) for col in data['columns']], data['scale'])
+
+    def normalize(self, obs):
+        """ Scale an (n, D) array of observations to index coordinates """
+        import numpy as np
+        obs = np.atleast_2d(np.asarray(obs, dtype = float))
+        if obs.shape[1] != len(self.columns):
+            raise ValueError('Observations must have columns {0}.'.format(self.columns))
+        return obs/self.scale
+
+    def nearest(self, obs, k = 1):
+        """ Batched k-nearest-neighbour query
+
+            Returns distances (in scaled units) and indices into the track
+            points, each with shape (n,) for k = 1 or (n, k) otherwise.
+        """
+        return self.tree.query(self.normalize(obs), k = k)
+
+    def radius(self, obs, r):
+        """ Indices of all track points within scaled distance r of each star """
+        return self.tree.query_ball_point(self.normalize(obs), r)
+
+    def posterior(self, obs, sigma, n_sigma = 4.0, k = 64):
+        """ Likelihood-weighted mass and age for a catalogue of stars
+
+            Every track point within n_sigma of a star in each observed
+            quantity, together with the k nearest points in index units, is
+            weighted by a Gaussian likelihood in the observed quantities
+            times the time step it represents (the evolutionary-speed
+            prior). Neighbours are thus chosen in sigma-scaled coordinates,
+            so all tracks consistent with the errors contribute, not only
+            the densely sampled track closest to the star.
+
+            Required Input:
+            ---------------
+                obs          ::    (n, D) observed values in index columns
+                sigma        ::    (D,) or (n, D) observational uncertainties
+
+            Optional Input: (default)
+            ---------------
+                n_sigma      ::    search half-width in units of sigma. (4.0)
+                k            ::    nearest points always included, so stars
+                                   off the grid still get an estimate. (64)
+
+            Returns:
+            --------
+            Dictionary of (n,) arrays: mass, mass_err, age, age_err and the
+            minimum chi^2, chi2_min, that can be used to flag poor fits.
+        """
+        import numpy as np
+
+        obs   = np.atleast_2d(np.asarray(obs, dtype = float))
+        sigma = np.asarray(sigma, dtype = float)*np.ones_like(obs)
+        # never ask for more neighbours than there are points
+        k = min(k, len(self.points))
+        dist, nearest = self.tree.query(self.normalize(obs), k = k)
+        nearest = np.atleast_2d(nearest.T).T
+
+        result = dict((key, np.zeros(len(obs))) for key in
+                      ['mass', 'mass_err', 'age', 'age_err', 'chi2_min'])
+        for i in range(len(obs)):
+            # the ball in index units encloses the n_sigma box around the star
+            r   = n_sigma*np.sqrt(((sigma[i]/self.scale)**2).sum())
+            idx = np.union1d(self.tree.query_ball_point(obs[i]/self.scale, r), nearest[i])
+            idx = idx.astype(int)
+
+            chi2 = (((self.points[idx] - obs[i])/sigma[i])**2).sum(axis = 1)
+            like = np.exp(-0.5*(chi2 - chi2.min()))*self.weight[idx]
+            like = like/like.sum()
+
+            mass = (like*self.mass[idx]).sum()
+            age  = (like*self.age[idx]).sum()
+            result['mass'][i]     = mass
+            result['mass_err'][i] = np.sqrt((like*(self.mass[idx] - mass)**2).sum())
+            result['age'][i]      = age
+            result['age_err'][i]  = np.sqrt((like*(self.age[idx] - age)**2).sum())
+            result['chi2_min'][i] = chi2.min()
+        return result
@@ -0,0 +1,78 @@
+#
+#
+import os
+import re
+
+# column layout of the DMESTAR evolution track (.trk, fort.37) output. columns
+# beyond the end of this list are named 'col<N>' (zero-based N).
+trk_columns = ['model', 'shells', 'age', 'log_L', 'log_R', 'log_g', 'log_Teff',
+               'm_core_conv', 'm_env_conv', 'r_env_conv', 'log_T_c', 'log_rho_c',
+               'log_P_c', 'x_c', 'z_c', 'x_surf', 'z_surf']
+
+# output root name written by Model.linkOutputData()
+fout_pattern = re.compile(r'm(?P<mass>\d{4})_(?P<mix>[A-Za-z0-9]+)_'
+                          r'(?P<feh_sign>[pm])(?P<feh>\d{3})_'
+                          r'(?P<afe_sign>[pm])(?P<afe>\d)_'
+                          r'mlt(?P<a_mlt>\d+\.\d+)'
+                          r'(?:_mag(?P<b_kG>\d+)kG|_magL(?P<lam>\d{4}))?')
+
+def parseName(filename):
+    """ Recover model properties from an output file name
+
+        Returns a dictionary with mass, mix, feh, afe, a_mlt, b_surf and
+        eq_lambda, or None if the name was not generated by Model. b_surf
+        is zero for non-magnetic models.
+    """
+    match = fout_pattern.match(os.path.basename(filename))
+    if match == None:
+        return None
+
+    sign = {'p': 1., 'm': -1.}
+    name = match.groupdict()
+    props = {'fout'  : match.group(0),
+             'mass'  : int(name['mass'])/1000.,
+             'mix'   : name['mix'],
+             'feh'   : sign[name['feh_sign']]*int(name['feh'])/100.,
+             'afe'   : sign[name['afe_sign']]*int(name['afe'])/10.,
+             'a_mlt' : float(name['a_mlt']),
+             'b_surf': 0.0,
+             'eq_lambda': 0.0}
+    if name['b_kG'] != None:
+        props['b_surf'] = int(name['b_kG'])*100.
+    if name['lam'] != None:
+        props['eq_lambda'] = int(name['lam'])/10000.
+    return props
+
+def columnNames(n_cols):
+    """ Names for the first n_cols columns of a track """
+    names = trk_columns[:n_cols]
+    return names + ['col{:.0f}'.format(i) for i in range(len(names), n_cols)]
+
+def readTrack(filename):
+    """ Read a .trk file into a dictionary of column arrays """
+    import numpy as np
+
+    data = np.loadtxt(filename, comments = '#', ndmin = 2)
+    track = dict(zip(columnNames(data.shape[1]), data.T))
+
+    # surface Z/X is used for calibration and fitting
+    if 'x_surf' in track and 'z_surf' in track:
+        track['zx_surf'] = track['z_surf']/track['x_surf']
+    return track
+
+def atAge(track, age, columns):
+    """ Linearly interpolate track columns to a given age (in yr) """
+    import numpy as np
+
+    if age < track['age'][0] or age > track['age'][-1]:
+        raise ValueError('Age {:.4e} outside of track age range.'.format(age))
+    return [float(np.interp(age, track['age'], track[col])) for col in columns]
+
+def findTracks(directory = None, extension = '.trk'):
+    """ List all output files of a given type in a grid directory """
+    import glob
+    from . import dirstruc as ds
+
+    if directory == None:
+        directory = ds.outdir
+    return sorted(glob.glob(os.path.join(directory, '*' + extension)))
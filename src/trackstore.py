@@ -0,0 +1,112 @@
+#
+#
+import json
+from . import tracks
+
+
+class TrackStore(object):
+
+    def __init__(self, filename):
+        """ Attach to a track store written by TrackStore.build()
+
+            All tracks of a grid are held in a single columnar array,
+            `filename`.npy, with shape (n_columns, n_rows) so that each
+            column of each track is one contiguous slice. The file is
+            memory-mapped read-only, so any number of worker processes
+            attached to the same store share one copy in the page cache.
+            Offsets, column names and model properties are read from the
+            index file, `filename`.idx.
+        """
+        import numpy as np
+
+        with open(filename + '.idx', 'r') as idx:
+            index = json.load(idx)
+        self.filename = filename
+        self.columns  = [str(col) for col in index['columns']]
+        self.names    = [str(name) for name in index['names']]
+        self.offsets  = index['offsets']
+        self.props    = dict(zip(self.names, index['props']))
+        self.position = dict((name, i) for i, name in enumerate(self.names))
+        self.col_num  = dict((col, j) for j, col in enumerate(self.columns))
+        self.data     = np.load(filename + '.npy', mmap_mode = 'r')
+
+    @classmethod
+    def build(cls, filename, directory = None, files = None):
+        """ Load every .trk in a grid once and write it as a single store
+
+            Each track is parsed once. Its columns are staged in binary form
+            in `filename`.stage until the full set of columns and the total
+            length are known, so building does not need the whole grid in
+            memory. Returns the attached store.
+        """
+        import os
+        import numpy as np
+        from numpy.lib.format import open_memmap
+
+        if files == None:
+            files = tracks.findTracks(directory)
+
+        # first pass: parse each track once, staging its columns
+        names, props, offsets, columns, staged = [], [], [0], [], []
+        stage = filename + '.stage'
+        try:
+            with open(stage, 'wb') as out:
+                for f in files:
+                    track = tracks.readTrack(f)
+                    for col in tracks.columnNames(len(track)) + sorted(track):
+                        if col in track and col not in columns:
+                            columns.append(col)
+                    info = tracks.parseName(f)
+                    names.append(info['fout'] if info != None else f)
+                    props.append(info)
+                    offsets.append(offsets[-1] + len(track['age']))
+                    staged.append(sorted(track))
+                    np.array([track[col] for col in staged[-1]], dtype = np.float64).tofile(out)
+
+            # second pass: copy staged columns into the columnar buffer,
+            # padding missing columns
+            data = open_memmap(filename + '.npy', mode = 'w+', dtype = np.float64,
+                               shape = (len(columns), offsets[-1]))
+            if os.path.getsize(stage) > 0:
+                buf, pos = np.memmap(stage, dtype = np.float64, mode = 'r'), 0
+                for i, track_cols in enumerate(staged):
+                    n_pts = offsets[i + 1] - offsets[i]
+                    block = buf[pos:pos + len(track_cols)*n_pts].reshape(len(track_cols), n_pts)
+                    pos  += block.size
+                    for j, col in enumerate(columns):
+                        if col in track_cols:
+                            data[j, offsets[i]:offsets[i + 1]] = block[track_cols.index(col)]
+                        else:
+                            data[j, offsets[i]:offsets[i + 1]] = np.nan
+                del buf
+            data.flush()
+            del data
+        finally:
+            if os.path.exists(stage):
+                os.remove(stage)
+
+        with open(filename + '.idx', 'w') as idx:
+            json.dump({'columns': columns, 'names': names,
+                       'offsets': offsets, 'props': props}, idx)
+        return cls(filename)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def track(self, name):
+        """ Read-only views of every column of one track (no copy) """
+        i = self.position[name]
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return dict((col, self.data[j, start:stop]) for col, j in self.col_num.items())
+
+    def column(self, col):
+        """ A single column concatenated over all tracks (no copy) """
+        return self.data[self.col_num[col]]
+
+    def select(self, **kwargs):
+        """ Names of tracks whose file-name properties match, e.g. feh = 0.0 """
+        return [name for name in self.names if self.props[name] != None and
+                all(self.props[name].get(key) == val for key, val in kwargs.items())]
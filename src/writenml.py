@@ -76,10 +76,19 @@ def writePolyNamelist(mass, x, z, afe, alpha_mlt, mix,
     if not poly_nml.closed:
         print "\nWARNING: Polytrope namelist file not closed properly.\n"
 
-def writePhysNamelist(mass, atm, tau, eos, turb_diff, nuclear_svals):
-    """ Write the physics namelist file """
+def physTemplate(mass):
+    """ Generalized physics namelist template used for a given mass """
     from . import dirstruc as ds
     
+    if mass <= 0.8:
+        return ds.nml + 'phys_low.nml'
+    elif 0.8 < mass < 1.8:
+        return ds.nml + 'phys_med.nml'
+    else:
+        return ds.nml + 'phys_high.nml'
+
+def writePhysNamelist(mass, atm, tau, eos, turb_diff, nuclear_svals):
+    """ Write the physics namelist file """
     if None in [mass, atm, turb_diff, eos, nuclear_svals]:
         er.valErrMissing()
         
@@ -87,12 +96,7 @@ def writePhysNamelist(mass, atm, tau, eos, turb_diff, nuclear_svals):
     atm_int = {'edd': 0, 'ks': 1, 'kur': 3, 'phx': 5}
     
     # specify generalized physics namelist
-    if mass <= 0.8:
-        phys_nml_file = ds.nml + 'phys_low.nml'
-    elif 0.8 < mass < 1.8:
-        phys_nml_file = ds.nml + 'phys_med.nml'
-    else:
-        phys_nml_file = ds.nml + 'phys_high.nml'
+    phys_nml_file = physTemplate(mass)
     
     phys_nml = open('physics.nml', 'w')
     phys_nml.write('! Auto-generated phyiscs namelist file\n')
@@ -144,7 +148,8 @@ def writePhysNamelist(mass, atm, tau, eos, turb_diff, nuclear_svals):
         print "WARNING: Physics namelist file was not properly closed."
     
 
-def writeCtrlNamelist(x, y, z, afe, a_mlt, mix, final_age = None, n_models = None):
+def writeCtrlNamelist(x, y, z, afe, a_mlt, mix, final_age = None, n_models = None,
+                      rescale_mass = None):
     """ Write the control namelist file """
     from dmestar.src import dirstruc as ds
     from os  import uname, getlogin
@@ -173,6 +178,8 @@ def writeCtrlNamelist(x, y, z, afe, a_mlt, mix, final_age = None, n_models = Non
     ctrl.write(' kindrn(1) = 2\n')
     ctrl.write(' lfirst(1) = .true.\n')
     ctrl.write(' nmodls(1) = 2\n')
+    if rescale_mass != None:
+        ctrl.write(' rsclm(1)  = {:.12f}\n'.format(rescale_mass))
     ctrl.write(' rsclx(1)  = {:.12f}\n'.format(x))
     ctrl.write(' rsclz(1)  = {:.12f}\n'.format(z))
     ctrl.write(' cmixla(1) = {:.12f}\n\n'.format(a_mlt))